@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Coin output parser benchmark for the Q1 Wallet (Python Edition)
+#
+# Generates synthetic 'token coins' and 'token coins metadata' outputs and
+# times the coin-text helpers used by menu.py (parse, amount lookup, coin
+# count, sum and render), together with their peak memory. Results are
+# written as JSON so runs of different versions can be compared:
+#
+#   python3 bench_coins.py --sizes 10000,100000,1000000 --output before.json
+#   python3 bench_coins.py --output after.json --compare before.json
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tracemalloc
+from pathlib import Path
+
+# Importing menu only defines its helpers: the dependency install and colorama setup run when
+# menu.py itself is executed, and colorama is optional here
+sys.path.insert(0, str(Path(__file__).parent.resolve()))
+import menu
+
+# Constants
+DEFAULT_SIZES = "10000,100000,1000000"
+DEFAULT_REPEATS = 3
+REGRESSION_THRESHOLD = 1.10
+
+# Synthetic Output Generation
+def generate_coins_output(count, metadata=False, seed=1):
+    rng = random.Random(seed)
+    base_frame = 9000000
+    lines = []
+    for i in range(count):
+        coin_id = "0x" + hashlib.sha256(f"{seed}:{i}".encode()).hexdigest()
+        line = f"{rng.uniform(0.000001, 50):.12f} QUIL (Coin {coin_id})"
+        if metadata:
+            ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1730000000 + i))
+            line += f" Frame {base_frame + i}, Timestamp {ts}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+# Benchmark Stages
+def stage_parse(output, coin_id):
+    return sum(1 for _ in menu.parse_coins(output))
+
+def stage_lookup(output, coin_id):
+    return menu.find_coin_amount(output, coin_id)
+
+def stage_count(output, coin_id):
+    return menu.count_coins(output)
+
+def stage_sum(output, coin_id):
+    return sum(coin[1] for coin in menu.parse_coins(output))
+
+def stage_render(output, coin_id):
+    with open(os.devnull, "w") as sink:
+        for _ in menu.render_lines(output.splitlines(), sink):
+            pass
+
+STAGES = [
+    ("parse", stage_parse),
+    ("lookup", stage_lookup),
+    ("count", stage_count),
+    ("sum", stage_sum),
+    ("render", stage_render),
+]
+
+def measure(func, output, coin_id, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(output, coin_id)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(output, coin_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+def run_benchmarks(sizes, repeats, stages):
+    results = []
+    for size in sizes:
+        for fmt in ("coins", "metadata"):
+            output = generate_coins_output(size, metadata=fmt == "metadata")
+            # Worst case lookup: the last coin in the listing
+            last_coin = menu.parse_coin_line(output.rstrip("\n").rsplit("\n", 1)[-1])[0]
+            for name, func in STAGES:
+                if stages and name not in stages:
+                    continue
+                seconds, peak = measure(func, output, last_coin, repeats)
+                results.append({
+                    "size": size,
+                    "format": fmt,
+                    "stage": name,
+                    "seconds": round(seconds, 6),
+                    "coins_per_second": round(size / seconds) if seconds else None,
+                    "peak_bytes": peak,
+                })
+                print(f"{size:>9} {fmt:<9} {name:<7} {seconds:>10.4f}s {peak / 1024 / 1024:>10.1f} MiB", flush=True)
+            del output
+    return results
+
+def compare_results(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["size"], r["format"], r["stage"]): r for r in baseline["results"]}
+    regressions = 0
+    print(f"\nComparison against {baseline_path} (version {baseline.get('version')}):")
+    for result in current:
+        old = previous.get((result["size"], result["format"], result["stage"]))
+        if not old or not old["seconds"]:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        marker = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        if marker:
+            regressions += 1
+        print(f"{result['size']:>9} {result['format']:<9} {result['stage']:<7} {ratio:>6.2f}x time, "
+              f"{result['peak_bytes'] / max(old['peak_bytes'], 1):>6.2f}x memory{marker}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Q1 Wallet coin output handling")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma separated coin counts (default: {DEFAULT_SIZES})")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="timing repeats per stage, best is kept")
+    parser.add_argument("--stages", default="", help="comma separated subset of: " + ",".join(name for name, _ in STAGES))
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    stages = [s for s in args.stages.split(",") if s]
+    print(f"{'coins':>9} {'format':<9} {'stage':<7} {'time':>11} {'peak':>14}")
+    results = run_benchmarks(sizes, args.repeats, stages)
+    report = {
+        "version": menu.SCRIPT_VERSION,
+        "python": platform.python_version(),
+        "platform": f"{platform.system().lower()}-{platform.machine().lower()}",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare and compare_results(results, args.compare):
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
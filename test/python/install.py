@@ -6,8 +6,22 @@ import platform
 import subprocess
 import re
 import shutil
+import hashlib
+import argparse
+import concurrent.futures
+import json
+import time
+import atexit
+import tarfile
+import tempfile
+import threading
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # Initial dependency check for Python and pip
 def check_python_and_pip():
     try:
@@ -36,6 +50,31 @@ def check_python_and_pip():
 
 check_python_and_pip()
 
+# Offline bundle: with --from-bundle, the archive is unpacked first so its wheelhouse can satisfy
+# the dependency check below without network access
+def unpack_bundle():
+    global BUNDLE_ERROR
+    path = next((sys.argv[i + 1] for i, a in enumerate(sys.argv[:-1]) if a == "--from-bundle"), None)
+    path = path or next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--from-bundle=")), None)
+    if not path:
+        return None
+    target = Path(tempfile.mkdtemp(prefix="q1wallet-bundle-"))
+    atexit.register(shutil.rmtree, target, ignore_errors=True)
+    try:
+        with tarfile.open(path) as tar:
+            for member in tar.getmembers():
+                if member.name.startswith(("/", "..")) or ".." in Path(member.name).parts or not (member.isfile() or member.isdir()):
+                    raise ValueError(f"unsafe path in bundle: {member.name}")
+            tar.extractall(target)
+    except (OSError, tarfile.TarError, ValueError) as e:
+        # Reported through finish() once the command line is parsed, so --summary-json sees it
+        BUNDLE_ERROR = f"Could not read bundle {path}: {e}"
+        return None
+    return target
+
+BUNDLE_ERROR = None
+BUNDLE_DIR = unpack_bundle()
+
 # Now check and install Python module dependencies
 def ensure_dependencies():
     required_modules = [("requests", "requests"), ("colorama", "colorama")]
@@ -51,8 +90,14 @@ def ensure_dependencies():
         return True
     
     print(f"Missing required Python modules: {', '.join(missing_modules)}")
+    if BUNDLE_ERROR:
+        # An offline install must not fall back to the network
+        print(f"\033[1;31m❌ {BUNDLE_ERROR}\033[0m")
+        return False
     print("Attempting to install them automatically...")
     pip_cmd = [sys.executable, "-m", "pip", "install"]
+    if BUNDLE_DIR:
+        pip_cmd += ["--no-index", "--find-links", str(BUNDLE_DIR / "wheelhouse")]
     
     for package in missing_modules:
         print(f"Installing {package}...")
@@ -79,9 +124,40 @@ colorama.init()
 SCRIPT_VERSION = "1.1.4"
 INSTALL_DIR = Path.home() / "q1wallet"  # Change this to Path.home() / "q1wallet_python" for your test
 SYMLINK_PATH = Path("/usr/local/bin/q1wallet") if os.name != "nt" else (INSTALL_DIR / "q1wallet.bat")
-MENU_URL = "https://raw.githubusercontent.com/lamat1111/Q1-Wallet/main/test/menu.py"
+MENU_URL = "https://raw.githubusercontent.com/lamat1111/Q1-Wallet/main/test/python/menu.py"
+MENU_ETAG_FILE = ".menu_etag.json"  # in INSTALL_DIR: ETag and digest of the installed menu.py
+RELEASE_POLICY_FILE = ".qclient_releases.json"  # in INSTALL_DIR: qclient pin and keep count set in menu.py
+RELEASE_KEEP = 3
 QCLIENT_RELEASE_URL = "https://releases.quilibrium.com/qclient-release"
 QUILIBRIUM_RELEASES = "https://releases.quilibrium.com"
+# Shared release cache, also used by menu.py. Set Q1WALLET_RELEASE_CACHE to share it between users or hosts.
+RELEASE_CACHE_DIR = Path(os.environ.get("Q1WALLET_RELEASE_CACHE") or Path.home() / ".cache" / "q1wallet" / "releases")
+FICLONE = 0x40049409  # Linux ioctl to reflink a file on copy-on-write filesystems (btrfs, xfs)
+RELEASE_CACHE_SHARED = bool(os.environ.get("Q1WALLET_RELEASE_CACHE"))
+MIRROR_CONCURRENCY = 4
+BUNDLE_PACKAGES = ["requests", "colorama"]
+BUNDLE_PYTHON_VERSION = "3.8"  # oldest Python the bundled wheels must support
+
+# Exit codes, also reported in the --summary-json output
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_UNSUPPORTED = 3
+EXIT_CANCELLED = 4
+EXIT_DOWNLOAD_FAILED = 5
+EXIT_BUNDLE_INVALID = 6
+EXIT_WALLET_EXISTS = 7
+
+# Unattended installs: every prompt has an answer key, set in an --answers JSON file, a
+# Q1WALLET_INSTALL_<KEY> environment variable or a flag (in increasing priority)
+ANSWER_KEYS = ("existing", "confirm_full_reinstall", "wallet", "wallet_exists", "symlink", "add_to_path", "start")
+ANSWERS = {}
+NON_INTERACTIVE = False
+SUMMARY_PATH = None
+SUMMARY_OUT = sys.stdout
+SUMMARY = {"installer_version": SCRIPT_VERSION, "install_dir": str(INSTALL_DIR), "action": "install", "source": "network",
+           "qclient": [], "wallet": None, "symlink": None}
+START_TIME = time.time()
 
 # Color definitions
 RED = Fore.RED + Style.BRIGHT
@@ -100,6 +176,33 @@ def warning_message(msg):
 def success_message(msg):
     return f"{GREEN}✅ {msg}{NC}"
 
+def answer(key, prompt, default=None):
+    if key in ANSWERS:
+        return ANSWERS[key]
+    if NON_INTERACTIVE:
+        return default
+    return input(prompt)
+
+def answer_yes(key, prompt, default=False):
+    value = answer(key, prompt)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("y", "yes", "true", "1")
+
+def finish(code, message=""):
+    if message:
+        print(error_message(message) if code not in (EXIT_OK, EXIT_CANCELLED) else message)
+    SUMMARY.update(status="ok" if code == EXIT_OK else "cancelled" if code == EXIT_CANCELLED else "failed",
+                   exit_code=code, message=message, duration_seconds=round(time.time() - START_TIME, 3))
+    if SUMMARY_PATH == "-":
+        SUMMARY_OUT.write(json.dumps(SUMMARY) + "\n")
+    elif SUMMARY_PATH:
+        with open(SUMMARY_PATH, "w") as f:
+            json.dump(SUMMARY, f, indent=2)
+    sys.exit(code)
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -113,7 +216,10 @@ def check_sudo():
     try:
         subprocess.run(["sudo", "-n", "true"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         return True
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        if NON_INTERACTIVE:
+            print(error_message("Passwordless sudo is required to create the quick command in unattended mode."))
+            return False
         print("Sudo access is required to create the quick command.")
         try:
             subprocess.run(["sudo", "true"], check=True)
@@ -127,11 +233,9 @@ def check_system_compatibility():
     arch = platform.machine().lower()
     supported_os = {"linux": ["x86_64", "aarch64"], "darwin": ["x86_64", "arm64"], "windows": ["x86_64", "amd64"]}
     if system not in supported_os:
-        print(error_message(f"Unsupported operating system: {system}"))
-        sys.exit(1)
+        finish(EXIT_UNSUPPORTED, f"Unsupported operating system: {system}")
     if arch not in supported_os[system]:
-        print(error_message(f"Unsupported architecture: {arch} on {system}"))
-        sys.exit(1)
+        finish(EXIT_UNSUPPORTED, f"Unsupported architecture: {arch} on {system}")
     return system, arch
 
 def check_existing_installation():
@@ -150,43 +254,36 @@ def check_existing_installation():
         print("2. Reinstall software only (keeps wallets and configuration)")
         print(f"3. Complete reinstall ({RED}WARNING: WILL DELETE ALL EXISTING WALLETS{NC})")
         
+        choices = {"1": "exit", "2": "reinstall", "3": "full-reinstall"}
         while True:
-            choice = input("Enter your choice (1-3): ")
-            if choice == "1":
-                print("Installation cancelled")
-                sys.exit(0)
-            elif choice == "2":
+            choice = str(answer("existing", "Enter your choice (1-3): ", "reinstall"))
+            choice = choices.get(choice, choice)
+            if choice == "exit":
+                finish(EXIT_CANCELLED, "Installation cancelled")
+            elif choice == "reinstall":
+                SUMMARY["action"] = "reinstall"
                 reinstall_software_only()
                 return True
-            elif choice == "3":
+            elif choice == "full-reinstall":
+                SUMMARY["action"] = "full-reinstall"
                 confirm_full_reinstall()
                 return True
+            if NON_INTERACTIVE or "existing" in ANSWERS:
+                finish(EXIT_USAGE, f"Invalid answer for 'existing': {choice} (use exit, reinstall or full-reinstall)")
             print(error_message("Invalid choice. Please enter 1, 2, or 3"))
 
 def reinstall_software_only():
+    # Nothing is deleted up front: the download steps compare each file with the latest
+    # release and replace only the ones that differ
     print("\nReinstalling Q1 Wallet software...")
-    print("Keeping existing wallets and configuration")
-    
-    current_wallet = INSTALL_DIR / ".current_wallet"
-    if current_wallet.exists():
-        shutil.copy(current_wallet, INSTALL_DIR / ".current_wallet.bak")
-    
-    for item in INSTALL_DIR.iterdir():
-        if item.name != "wallets":
-            if item.is_dir():
-                shutil.rmtree(item)
-            else:
-                item.unlink()
-    
-    if (INSTALL_DIR / ".current_wallet.bak").exists():
-        shutil.move(INSTALL_DIR / ".current_wallet.bak", current_wallet)
+    print("Keeping existing wallets and configuration, only changed files will be replaced")
 
 def confirm_full_reinstall():
     print(f"\n{RED}WARNING: This will delete ALL existing wallets and data in {INSTALL_DIR}{NC}")
     print("This action cannot be undone!")
-    if input("Do you want to proceed? (y/n): ").lower() != "y":
-        print("Installation cancelled")
-        sys.exit(0)
+    # Unattended, choosing full-reinstall explicitly is the confirmation
+    if not answer_yes("confirm_full_reinstall", "Do you want to proceed? (y/n): ", default=True):
+        finish(EXIT_CANCELLED, "Installation cancelled")
     shutil.rmtree(INSTALL_DIR, ignore_errors=True)
     INSTALL_DIR.mkdir(parents=True)
 
@@ -197,7 +294,10 @@ def handle_wallet_creation(wallet_name):
     if wallet_name:
         if check_wallet_exists(wallet_name):
             print(warning_message(f"Wallet '{wallet_name}' already exists"))
-            if input("Would you like to create a different wallet? (y/n): ").lower() == "y":
+            policy = answer("wallet_exists", "Would you like to create a different wallet? (y/n): ", "skip")
+            if policy == "fail":
+                finish(EXIT_WALLET_EXISTS, f"Wallet '{wallet_name}' already exists")
+            if str(policy).lower() in ("y", "yes") and not NON_INTERACTIVE:
                 while True:
                     wallet_name = input("Enter new wallet name (a-z, 0-9, -, _): ")
                     if not re.match(r"^[a-z0-9_-]+$", wallet_name):
@@ -228,7 +328,8 @@ def setup_symlink(system):
             f.write(bat_content)
         SYMLINK_PATH.chmod(0o755)
         
-        if input("Add to PATH for 'q1wallet' command? (requires admin, y/n): ").lower() == "y":
+        SUMMARY["symlink"] = str(SYMLINK_PATH)
+        if answer_yes("add_to_path", "Add to PATH for 'q1wallet' command? (requires admin, y/n): "):
             if not check_sudo():
                 print(error_message("Admin access required to modify PATH"))
                 print(f"Run manually with: {SYMLINK_PATH}")
@@ -247,12 +348,13 @@ def setup_symlink(system):
             print(f"Run manually with: {SYMLINK_PATH}")
     else:
         print("Create a 'q1wallet' command to call the menu from anywhere.")
-        if input("Would you like to set up the quick command? (y/n): ").lower() != "y":
+        if not answer_yes("symlink", "Would you like to set up the quick command? (y/n): "):
             print(f"Skipping quick command setup. Run 'python3 {INSTALL_DIR / 'menu.py'}' to use.")
             return
         
         if SYMLINK_PATH.exists() and SYMLINK_PATH.resolve() == (INSTALL_DIR / "menu.py"):
             print(success_message("Command 'q1wallet' is already set up correctly"))
+            SUMMARY["symlink"] = str(SYMLINK_PATH)
             return
         
         if not check_sudo():
@@ -267,6 +369,7 @@ def setup_symlink(system):
         try:
             subprocess.run(["sudo", "ln", "-sf", str(INSTALL_DIR / "menu.py"), str(SYMLINK_PATH)], check=True)
             if SYMLINK_PATH.exists():
+                SUMMARY["symlink"] = str(SYMLINK_PATH)
                 print(success_message("Command 'q1wallet' installed successfully!"))
                 print("You can now run 'q1wallet' from anywhere")
             else:
@@ -275,8 +378,438 @@ def setup_symlink(system):
             print(error_message("Failed to create quick command 'q1wallet'"))
             print(f"To create it later, run: sudo ln -sf {INSTALL_DIR / 'menu.py'} {SYMLINK_PATH}")
 
+# Release Cache
+# objects/<digest[:2]>/<digest> holds the file contents, names/<release file name> the digest of that
+# file. Release file names are never reused, so a cached name can be installed without any download.
+# Binaries are only stored and installed when they match the SHA3-256 digest of their .dgst file.
+# RELEASE CACHE START: menu.py holds the source of this section, install.py an identical copy (install.py --check-release-cache)
+def release_cache_object(digest):
+    return RELEASE_CACHE_DIR / "objects" / digest[:2] / digest
+
+def release_tmp_name(path):
+    # Unique per process and thread, installs and mirror runs write from several threads
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def is_signature_file(name):
+    return name.endswith((".dgst", ".sig")) or ".sig." in name
+
+def cached_object_digest(digest):
+    h = hashlib.sha3_256()
+    with open(release_cache_object(digest), "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cached_release_digest(name, expected=None):
+    # Digest of the cached file, or None when it is not cached or does not match expected. Objects of a
+    # shared cache (Q1WALLET_RELEASE_CACHE) are hashed again, other hosts and users write to it too.
+    try:
+        digest = (RELEASE_CACHE_DIR / "names" / name).read_text().strip()
+        if not release_cache_object(digest).exists() or (expected and digest != expected):
+            return None
+        if RELEASE_CACHE_SHARED and cached_object_digest(digest) != digest:
+            return None
+    except OSError:
+        return None
+    return digest
+
+def store_release_file(name, content):
+    digest = hashlib.sha3_256(content).hexdigest()
+    obj = release_cache_object(digest)
+    if not obj.exists() or (RELEASE_CACHE_SHARED and cached_object_digest(digest) != digest):
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = release_tmp_name(obj)
+        tmp.write_bytes(content)
+        tmp.chmod(0o644 if is_signature_file(name) else 0o755)
+        os.replace(tmp, obj)
+    entry = RELEASE_CACHE_DIR / "names" / name
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = release_tmp_name(entry)
+    tmp.write_text(digest)
+    os.replace(tmp, entry)
+    return digest
+
+def link_release_file(digest, dest):
+    # Hardlink when the cache is on the same filesystem, else reflink, else copy
+    obj = release_cache_object(digest)
+    tmp = release_tmp_name(dest)
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(obj, tmp)
+    except OSError:
+        with open(obj, "rb") as src, open(tmp, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except (AttributeError, OSError):
+                shutil.copyfileobj(src, dst)
+        shutil.copymode(obj, tmp)
+    os.replace(tmp, dest)
+
+def parse_release_digest(text):
+    match = re.search(r"[0-9a-fA-F]{64}", text)
+    return match.group().lower() if match else None
+
+def download_release_content(name, expected=None):
+    # Raises for HTTP errors and for content that fails its check, so error pages are never cached
+    response = release_http_get(f"{QUILIBRIUM_RELEASES}/{name}")
+    response.raise_for_status()
+    if name.endswith(".dgst") and not parse_release_digest(response.content.decode(errors="replace")):
+        raise ValueError(f"{name} does not contain a SHA3-256 digest")
+    if expected and hashlib.sha3_256(response.content).hexdigest() != expected:
+        raise ValueError(f"{name} does not match its published digest")
+    return response.content
+
+def published_release_digest(name):
+    # The digest published in <name>.dgst, None for .dgst and signature files themselves
+    if is_signature_file(name):
+        return None
+    digest = cached_release_digest(f"{name}.dgst")
+    if digest:
+        return parse_release_digest(release_cache_object(digest).read_text(errors="replace"))
+    content = download_release_content(f"{name}.dgst")
+    try:
+        store_release_file(f"{name}.dgst", content)
+    except OSError:
+        pass
+    return parse_release_digest(content.decode(errors="replace"))
+
+def download_release_file(name):
+    # Returns the digest of the verified cached file, downloading it only if it is not cached yet
+    expected = published_release_digest(name)
+    return cached_release_digest(name, expected) or store_release_file(name, download_release_content(name, expected))
+
+def fetch_release_file(name, dest):
+    # Installs a verified release file from the cache, downloading it into the cache first if needed.
+    # Returns True when no download was necessary.
+    expected = published_release_digest(name)
+    digest = cached_release_digest(name, expected)
+    if digest:
+        link_release_file(digest, dest)
+        return True
+    content = download_release_content(name, expected)
+    try:
+        link_release_file(store_release_file(name, content), dest)
+    except OSError:
+        # Cache not writable, install the download directly
+        dest.write_bytes(content)
+        if not is_signature_file(name):
+            dest.chmod(0o755)
+    return False
+# RELEASE CACHE END
+
+def release_cache_section(source):
+    # The code between the RELEASE CACHE markers, or None
+    match = re.search(r"^# RELEASE CACHE START.*?^# RELEASE CACHE END", source, re.MULTILINE | re.DOTALL)
+    return match.group(0) if match else None
+
+def check_release_cache_copy(menu_source, origin):
+    # Both scripts write the shared release cache, so a copy that drifted from menu.py could lay it out
+    # differently. Called before any release file is downloaded or installed.
+    if release_cache_section(menu_source) != release_cache_section(Path(__file__).read_text(encoding="utf-8")):
+        finish(EXIT_FAILED, f"The release cache code of install.py differs from {origin}. "
+                            "Use the install.py published with this menu.py.")
+
+def release_http_get(url):
+    return requests.get(url, timeout=300)
+
+def file_digest(path):
+    h = hashlib.sha3_256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+def replace_if_changed(path, content, mode):
+    # Atomically swaps in the new content, unless the file already has it. Returns True if replaced.
+    if file_digest(path) == hashlib.sha3_256(content).hexdigest():
+        return False
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(content)
+    tmp.chmod(mode)
+    os.replace(tmp, path)
+    return True
+
+def release_file_current(name, dest):
+    # True when dest already holds the release file. A binary must match the digest published in its
+    # (already updated) .dgst: as a hardlink to the verified cached object, or by hashing it.
+    if not dest.exists():
+        return False
+    if is_signature_file(name):
+        digest = cached_release_digest(name)
+        return bool(digest) and (os.path.samefile(release_cache_object(digest), dest) or file_digest(dest) == digest)
+    try:
+        published = parse_release_digest(dest.with_name(f"{name}.dgst").read_text(errors="replace"))
+    except OSError:
+        return False
+    if not published:
+        return False
+    digest = cached_release_digest(name, published)
+    if digest and os.path.samefile(release_cache_object(digest), dest):
+        return True
+    if file_digest(dest) != published:
+        return False
+    adopt_release_file(name, dest, published)
+    return True
+
+def adopt_release_file(name, dest, digest):
+    # Adds a verified installed file to the cache, so later runs only compare inodes
+    obj = release_cache_object(digest)
+    try:
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        if not obj.exists():
+            os.link(dest, obj)
+        entry = RELEASE_CACHE_DIR / "names" / name
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        entry.write_text(digest)
+    except OSError:
+        pass
+
+def update_menu():
+    # Conditional GET with the ETag of the installed menu.py; a 304 costs one round trip
+    etag_file = INSTALL_DIR / MENU_ETAG_FILE
+    try:
+        state = json.loads(etag_file.read_text())
+    except (OSError, ValueError):
+        state = {}
+    headers = {}
+    if state.get("etag") and state.get("sha3_256") == file_digest(INSTALL_DIR / "menu.py"):
+        headers["If-None-Match"] = state["etag"]
+    response = requests.get(MENU_URL, headers=headers, timeout=60)
+    if response.status_code == 304:
+        print("menu.py is up to date")
+        return
+    response.raise_for_status()
+    if replace_if_changed(INSTALL_DIR / "menu.py", response.content, 0o755):
+        print("Installed the latest menu.py")
+    else:
+        print("menu.py is up to date")
+    if response.headers.get("ETag"):
+        etag_file.write_text(json.dumps({"etag": response.headers["ETag"], "sha3_256": hashlib.sha3_256(response.content).hexdigest()}))
+
+def prune_releases(release_os, release_arch, latest_version, latest_files):
+    # Same retention as prune_releases in menu.py: the newest `keep` versions and the pinned one stay
+    # installed for rollback. Files of the latest version that are no longer published are removed.
+    try:
+        policy = json.loads((INSTALL_DIR / RELEASE_POLICY_FILE).read_text())
+    except (OSError, ValueError):
+        policy = {}
+    keep = max(1, int(policy.get("keep", RELEASE_KEEP)))
+    files = {}
+    for f in INSTALL_DIR.glob(f"qclient-*-{release_os}-{release_arch}*"):
+        match = re.match(r"qclient-(\d+\.\d+\.\d+\.\d*)-", f.name)
+        if match:
+            files.setdefault(match.group(1), []).append(f)
+    installed = [v for v, fs in files.items() if any(not is_signature_file(f.name) and not f.name.endswith("Zone.Identifier") for f in fs)]
+    installed.sort(key=lambda v: [int(p) if p.isdigit() else 0 for p in v.split('.')], reverse=True)
+    retained = set(installed[:keep]) | {policy.get("pinned"), latest_version}
+    for version, fs in files.items():
+        for f in fs:
+            if version not in retained or (version == latest_version and f.name not in latest_files):
+                print(f"Removing {f.name}")
+                f.unlink()
+
+def release_platform(system, arch):
+    os_map = {"linux": "linux", "darwin": "darwin", "windows": "windows"}
+    arch_map = {"x86_64": "amd64", "amd64": "amd64", "aarch64": "arm64", "arm64": "arm64"}
+    return os_map[system], arch_map[arch]
+
+def latest_release_files(files):
+    # {(os, arch): [files of the latest version]} for every platform in the release list
+    latest = {}
+    for f in files:
+        match = re.match(r"qclient-(\d+\.\d+\.\d+\.\d*)-([a-z]+)-([a-z0-9]+)", f)
+        if match:
+            version, key = match.group(1), (match.group(2), match.group(3))
+            if key not in latest or [int(p) for p in version.split('.')] > [int(p) for p in latest[key].split('.')]:
+                latest[key] = version
+    return {key: [f for f in files if f.startswith(f"qclient-{version}-{key[0]}-{key[1]}")] for key, version in latest.items()}
+
+def mirror_release_cache():
+    print(f"Mirroring the latest qclient release for all platforms into {RELEASE_CACHE_DIR}...")
+    response = requests.get(MENU_URL, timeout=30)
+    response.raise_for_status()
+    check_release_cache_copy(response.text, "the published menu.py")
+    response = requests.get(QCLIENT_RELEASE_URL, timeout=30)
+    response.raise_for_status()
+    files = response.text.splitlines()
+    wanted = [f for platform_files in latest_release_files(files).values() for f in platform_files]
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MIRROR_CONCURRENCY) as pool:
+        futures = {pool.submit(download_release_file, f): f for f in wanted}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                print(f"{futures[future]}  {future.result()[:16]}")
+            except Exception as e:
+                failed += 1
+                print(error_message(f"{futures[future]}: {e}"))
+    if failed:
+        finish(EXIT_DOWNLOAD_FAILED, f"{failed} of {len(wanted)} files could not be mirrored")
+    print(success_message(f"{len(wanted)} files cached"))
+    finish(EXIT_OK)
+
+def create_bundle(output, platforms):
+    print(f"Creating offline bundle {output}...")
+    response = requests.get(QCLIENT_RELEASE_URL, timeout=30)
+    response.raise_for_status()
+    files = response.text.splitlines()
+    available = latest_release_files(files)
+    keys = list(available) if platforms == ["all"] else [tuple(p.split("-", 1)) for p in platforms]
+    missing = [f"{k[0]}-{k[1]}" for k in keys if k not in available]
+    if missing:
+        finish(EXIT_UNSUPPORTED, f"No qclient release for: {', '.join(missing)}")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        response = requests.get(MENU_URL, timeout=30)
+        response.raise_for_status()
+        check_release_cache_copy(response.text, "the published menu.py")
+        (root / "menu.py").write_bytes(response.content)
+        shutil.copy(Path(__file__), root / "install.py")
+        print("Downloading wheels for: " + ", ".join(BUNDLE_PACKAGES))
+        pip_download = [sys.executable, "-m", "pip", "download", "--quiet", "-d", str(root / "wheelhouse")]
+        # Prefer pure Python wheels, so the bundle works with any Python 3 on any platform
+        portable = ["--only-binary=:all:", "--platform", "any", "--implementation", "py", "--python-version", BUNDLE_PYTHON_VERSION]
+        if subprocess.run(pip_download + portable + BUNDLE_PACKAGES).returncode != 0:
+            subprocess.run(pip_download + BUNDLE_PACKAGES, check=True)
+        digests = {}
+        names = [name for key in keys for name in available[key]]
+        for name in names:
+            print(f"Adding {name}...")
+            digests[name] = download_release_file(name)
+        (root / "releases").mkdir()
+        for name, digest in digests.items():
+            shutil.copy2(release_cache_object(digest), root / "releases" / name)
+        manifest = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "installer_version": SCRIPT_VERSION,
+            "menu_sha3_256": hashlib.sha3_256(response.content).hexdigest(),
+            "platforms": [f"{k[0]}-{k[1]}" for k in keys],
+            "releases": digests,
+        }
+        (root / "manifest.json").write_text(json.dumps(manifest, indent=2))
+        with tarfile.open(output, "w:gz") as tar:
+            for item in sorted(root.iterdir()):
+                tar.add(item, arcname=item.name)
+    print(success_message(f"Bundle written to {output} ({Path(output).stat().st_size / 1024 / 1024:.1f} MiB)"))
+    finish(EXIT_OK)
+
+def install_from_bundle(release_os, release_arch):
+    # Installs menu.py and the qclient files of this platform from the unpacked bundle, checking
+    # each file against the digests recorded when the bundle was made
+    try:
+        manifest = json.loads((BUNDLE_DIR / "manifest.json").read_text())
+        menu = (BUNDLE_DIR / "menu.py").read_bytes()
+        menu_digest, releases, platforms = manifest["menu_sha3_256"], dict(manifest["releases"]), list(manifest["platforms"])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        finish(EXIT_BUNDLE_INVALID, f"Not a valid bundle, missing or malformed manifest.json or menu.py: {e}")
+    if hashlib.sha3_256(menu).hexdigest() != menu_digest:
+        finish(EXIT_BUNDLE_INVALID, "menu.py in the bundle is corrupted")
+    check_release_cache_copy(menu.decode("utf-8", errors="replace"), "the menu.py in the bundle")
+    replace_if_changed(INSTALL_DIR / "menu.py", menu, 0o755)
+    names = [n for n in releases if re.match(rf"qclient-[\d.]+-{release_os}-{release_arch}\b", n)]
+    if not names:
+        finish(EXIT_BUNDLE_INVALID, f"The bundle has no qclient for {release_os}-{release_arch} (it has: {', '.join(platforms)})")
+    for name in names:
+        SUMMARY["qclient"].append(name)
+        if file_digest(INSTALL_DIR / name) == releases[name]:
+            print(f"{name} is up to date")
+            continue
+        try:
+            content = (BUNDLE_DIR / "releases" / name).read_bytes()
+        except OSError as e:
+            finish(EXIT_BUNDLE_INVALID, f"{name} is listed in the bundle manifest but missing: {e}")
+        if hashlib.sha3_256(content).hexdigest() != releases[name]:
+            finish(EXIT_BUNDLE_INVALID, f"{name} in the bundle is corrupted")
+        print(f"Installing {name}...")
+        try:
+            link_release_file(store_release_file(name, content), INSTALL_DIR / name)
+        except OSError:
+            (INSTALL_DIR / name).write_bytes(content)
+            if not is_signature_file(name):
+                (INSTALL_DIR / name).chmod(0o755)
+
 # Main Installer Logic
-clear_screen()
+parser = argparse.ArgumentParser(description="Q1 Wallet installer")
+parser.add_argument("--cache-dir", help=f"shared release cache directory (default: {RELEASE_CACHE_DIR})")
+parser.add_argument("--mirror", action="store_true", help="download the latest qclient release for all platforms into the cache and exit")
+parser.add_argument("--bundle", metavar="FILE", help="write an offline install bundle (.tar.gz) and exit")
+parser.add_argument("--platforms", default="", help="platforms for --bundle, e.g. linux-amd64,darwin-arm64 or 'all' (default: this one)")
+parser.add_argument("--from-bundle", metavar="FILE", help="install from a bundle made with --bundle, without network access")
+parser.add_argument("--check-release-cache", metavar="MENU", help="check that the release cache code matches the given menu.py and exit")
+unattended = parser.add_argument_group("unattended install", "each option can also be set in an --answers JSON file "
+                                       "or as a Q1WALLET_INSTALL_<OPTION> environment variable")
+unattended.add_argument("--non-interactive", action="store_true", help="never prompt; unanswered questions use safe defaults")
+unattended.add_argument("--answers", metavar="FILE", help="JSON file with answers, e.g. {\"existing\": \"reinstall\", \"wallet\": \"node1\"}")
+unattended.add_argument("--install-dir", help=f"install location (default: {INSTALL_DIR})")
+unattended.add_argument("--existing", choices=("exit", "reinstall", "full-reinstall"), help="what to do with an existing install (default: reinstall)")
+unattended.add_argument("--wallet", help="create this wallet")
+unattended.add_argument("--wallet-exists", choices=("skip", "fail"), help="when --wallet already exists (default: skip)")
+unattended.add_argument("--symlink", action="store_const", const=True, help="create the q1wallet command (needs passwordless sudo)")
+unattended.add_argument("--no-symlink", dest="symlink", action="store_const", const=False, help="do not create the q1wallet command")
+unattended.add_argument("--add-to-path", action="store_const", const=True, help="Windows: add the install directory to PATH")
+unattended.add_argument("--summary-json", metavar="FILE", help="write a JSON summary to FILE, or to stdout with '-' (other output goes to stderr)")
+args = parser.parse_args()
+
+SUMMARY_PATH = args.summary_json
+if SUMMARY_PATH == "-":
+    # stdout carries only the summary: file descriptor 1 is pointed at stderr, so the output of
+    # child processes (pip, sudo, setx, the menu) goes there too
+    sys.stdout.flush()
+    SUMMARY_OUT = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+if BUNDLE_ERROR:
+    finish(EXIT_BUNDLE_INVALID, BUNDLE_ERROR)
+NON_INTERACTIVE = args.non_interactive or os.environ.get("Q1WALLET_INSTALL_NON_INTERACTIVE", "").lower() in ("1", "true", "yes")
+if args.answers:
+    try:
+        with open(args.answers) as f:
+            ANSWERS = json.load(f)
+    except (OSError, ValueError) as e:
+        finish(EXIT_USAGE, f"Could not read answers file: {e}")
+    unknown = set(ANSWERS) - set(ANSWER_KEYS) - {"install_dir"}
+    if unknown:
+        finish(EXIT_USAGE, f"Unknown keys in answers file: {', '.join(sorted(unknown))}")
+for key in ANSWER_KEYS + ("install_dir",):
+    if os.environ.get(f"Q1WALLET_INSTALL_{key.upper()}") is not None:
+        ANSWERS[key] = os.environ[f"Q1WALLET_INSTALL_{key.upper()}"]
+    if getattr(args, key, None) is not None:
+        ANSWERS[key] = getattr(args, key)
+if ANSWERS.get("install_dir"):
+    INSTALL_DIR = Path(ANSWERS.pop("install_dir")).expanduser().resolve()
+    if os.name == "nt":
+        SYMLINK_PATH = INSTALL_DIR / "q1wallet.bat"
+    SUMMARY["install_dir"] = str(INSTALL_DIR)
+if args.check_release_cache:
+    try:
+        menu_source = Path(args.check_release_cache).read_text(encoding="utf-8")
+    except OSError as e:
+        finish(EXIT_USAGE, f"Could not read {args.check_release_cache}: {e}")
+    check_release_cache_copy(menu_source, args.check_release_cache)
+    finish(EXIT_OK, "The release cache code of install.py and menu.py is identical")
+if args.cache_dir:
+    RELEASE_CACHE_DIR = Path(args.cache_dir).expanduser()
+    RELEASE_CACHE_SHARED = True
+if args.mirror:
+    try:
+        mirror_release_cache()
+    except (requests.RequestException, OSError) as e:
+        finish(EXIT_DOWNLOAD_FAILED, f"Mirror failed: {e}")
+if args.bundle:
+    if args.platforms:
+        bundle_platforms = [p.strip() for p in args.platforms.split(",") if p.strip()]
+    else:
+        bundle_platforms = ["-".join(release_platform(*check_system_compatibility()))]
+    try:
+        create_bundle(args.bundle, bundle_platforms)
+    except (requests.RequestException, OSError, ValueError, subprocess.CalledProcessError, tarfile.TarError) as e:
+        finish(EXIT_DOWNLOAD_FAILED, f"Bundle failed: {e}")
+
+if not NON_INTERACTIVE:
+    clear_screen()
 print(f"""
                     Q1Q1Q1\\    Q1\\   
                    Q1  __Q1\\ Q1Q1 |  
@@ -291,56 +824,72 @@ print(f"""
              Welcome to Q1 Wallet Installer - {SCRIPT_VERSION}
 =================================================================""")
 system, arch = check_system_compatibility()
+SUMMARY["platform"] = f"{system}-{arch}"
 check_existing_installation()
+INSTALL_DIR.mkdir(parents=True, exist_ok=True)
 os.chdir(INSTALL_DIR)
 
-print("\nWould you like to create a new wallet now? (y/n): ")
 wallet_name = ""
-if input().lower() == "y":
-    while True:
-        wallet_name = input("Enter wallet name (a-z, 0-9, -, _): ")
-        if not re.match(r"^[a-z0-9_-]+$", wallet_name):
-            print(error_message("Invalid wallet name. Use only lowercase letters, numbers, dashes, underscores"))
-            continue
-        if check_wallet_exists(wallet_name):
-            print(error_message(f"Wallet '{wallet_name}' already exists"))
-            continue
-        break
+if "wallet" in ANSWERS or NON_INTERACTIVE:
+    wallet_name = ANSWERS.get("wallet") or ""
+    if wallet_name and not re.match(r"^[a-z0-9_-]+$", wallet_name):
+        finish(EXIT_USAGE, f"Invalid wallet name '{wallet_name}'. Use only lowercase letters, numbers, dashes, underscores")
+else:
+    print("\nWould you like to create a new wallet now? (y/n): ")
+    if input().lower() == "y":
+        while True:
+            wallet_name = input("Enter wallet name (a-z, 0-9, -, _): ")
+            if not re.match(r"^[a-z0-9_-]+$", wallet_name):
+                print(error_message("Invalid wallet name. Use only lowercase letters, numbers, dashes, underscores"))
+                continue
+            if check_wallet_exists(wallet_name):
+                print(error_message(f"Wallet '{wallet_name}' already exists"))
+                continue
+            break
 
 print("\nCreating directory structure...")
 (INSTALL_DIR / "wallets").mkdir(parents=True, exist_ok=True)
 
-print("Downloading Q1 Wallet script...")
-response = requests.get(MENU_URL)
-with open(INSTALL_DIR / "menu.py", "wb") as f:
-    f.write(response.content)
-(INSTALL_DIR / "menu.py").chmod(0o755)
-
 print(f"Detecting system: {system}-{arch}")
-os_map = {"linux": "linux", "darwin": "darwin", "windows": "windows"}
-arch_map = {"x86_64": "amd64", "amd64": "amd64", "aarch64": "arm64", "arm64": "arm64"}
-release_os = os_map[system]
-release_arch = arch_map[arch]
+release_os, release_arch = release_platform(system, arch)
 suffix = ".exe" if system == "windows" else ""
 
-print(f"\nDownloading qclient for {release_os}-{release_arch}...")
-files = requests.get(QCLIENT_RELEASE_URL).text.splitlines()
-version_pattern = rf"qclient-(\d+\.\d+\.\d+\.\d*)-{release_os}-{release_arch}{suffix}"
-versions = [re.search(version_pattern, f).group(1) for f in files if re.search(version_pattern, f)]
-if not versions:
-    print(error_message(f"No qclient files found for {release_os}-{release_arch}"))
-    sys.exit(1)
-latest_version = max(versions, key=lambda x: [int(p) for p in x.split('.')])
-matched_files = [f for f in files if f"qclient-{latest_version}-{release_os}-{release_arch}" in f]
-for file in matched_files:
-    print(f"Downloading {file}...")
-    response = requests.get(f"{QUILIBRIUM_RELEASES}/{file}", timeout=300)
-    with open(INSTALL_DIR / file, "wb") as f:
-        f.write(response.content)
-    if not file.endswith((".dgst", ".sig")):
-        (INSTALL_DIR / file).chmod(0o755)
+if BUNDLE_DIR:
+    print(f"\nInstalling from bundle {args.from_bundle}...")
+    SUMMARY["source"] = "bundle"
+    install_from_bundle(release_os, release_arch)
+else:
+    try:
+        print("Checking Q1 Wallet script...")
+        update_menu()
+        check_release_cache_copy((INSTALL_DIR / "menu.py").read_text(encoding="utf-8", errors="replace"), "the installed menu.py")
+
+        print(f"\nChecking qclient for {release_os}-{release_arch}...")
+        response = requests.get(QCLIENT_RELEASE_URL, timeout=60)
+        response.raise_for_status()
+        files = response.text.splitlines()
+        version_pattern = rf"qclient-(\d+\.\d+\.\d+\.\d*)-{release_os}-{release_arch}{suffix}"
+        versions = [re.search(version_pattern, f).group(1) for f in files if re.search(version_pattern, f)]
+        if not versions:
+            finish(EXIT_DOWNLOAD_FAILED, f"No qclient files found for {release_os}-{release_arch}")
+        latest_version = max(versions, key=lambda x: [int(p) for p in x.split('.')])
+        matched_files = [f for f in files if f"qclient-{latest_version}-{release_os}-{release_arch}" in f]
+        # .dgst files first, so binaries can be checked against the current published digest
+        for file in sorted(matched_files, key=lambda f: not f.endswith(".dgst")):
+            if release_file_current(file, INSTALL_DIR / file):
+                print(f"{file} is up to date")
+            else:
+                print(f"Installing {file} from the release cache..." if cached_release_digest(file) else f"Downloading {file}...")
+                fetch_release_file(file, INSTALL_DIR / file)
+            SUMMARY["qclient"].append(file)
+        prune_releases(release_os, release_arch, latest_version, matched_files)
+    except (requests.RequestException, OSError, ValueError) as e:
+        # ValueError: a release file did not match its published digest
+        finish(EXIT_DOWNLOAD_FAILED, f"Download failed: {e}")
+SUMMARY["menu"] = str(INSTALL_DIR / "menu.py")
 
 wallet_name = handle_wallet_creation(wallet_name)
+SUMMARY["wallet"] = wallet_name or None
 
 print("\n" + success_message("Installation completed successfully!"))
 print(f"\nInstallation details:\n--------------------\nLocation: {INSTALL_DIR}")
@@ -362,5 +911,6 @@ IMPORTANT SECURITY STEPS:
 
 setup_symlink(system)
 
-if input("\nWould you like to start Q1 Wallet now? (y/n): ").lower() == "y":
-    subprocess.run([sys.executable, str(INSTALL_DIR / "menu.py")])
\ No newline at end of file
+if not NON_INTERACTIVE and answer_yes("start", "\nWould you like to start Q1 Wallet now? (y/n): "):
+    subprocess.run([sys.executable, str(INSTALL_DIR / "menu.py")])
+finish(EXIT_OK)
\ No newline at end of file
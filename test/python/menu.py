@@ -11,16 +11,42 @@ import zipfile
 from pathlib import Path
 import threading
 import signal
+import json
+import collections
+import argparse
+import io
+import cProfile
+import pstats
+import tracemalloc
+import tempfile
+import shlex
+import bisect
+import fnmatch
+import concurrent.futures
+import contextlib
+import itertools
+import string
+import calendar
+import csv
+import importlib.util
+import socket
+import socketserver
+import struct
+import atexit
+import mmap
+import hashlib
+from array import array
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
 
 # Function to check and install dependencies
 def ensure_dependencies():
     required_modules = [("requests", "requests"), ("colorama", "colorama")]
     missing_modules = []
     
+    # find_spec only locates the modules; requests is imported lazily when the first HTTP call is made
     for module_name, package_name in required_modules:
-        try:
-            __import__(module_name)
-        except ImportError:
+        if importlib.util.find_spec(module_name) is None:
             missing_modules.append(package_name)
     
     if not missing_modules:
@@ -58,17 +84,32 @@ def ensure_dependencies():
     print("✅ All dependencies are now installed.")
     return True
 
-# Run dependency check before any imports that require external modules
-if not ensure_dependencies():
+# Run dependency check before any imports that require external modules. Only when run as a script:
+# importing menu as a library must not install packages or exit the importing program.
+if __name__ == "__main__" and not ensure_dependencies():
     sys.exit(1)
 
-# Now safe to import requests and colorama
-import requests
-import colorama
-from colorama import Fore, Style
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Now safe to import colorama. Tools that import menu only for its helpers (e.g. bench_coins.py)
+# also work without it, with plain ANSI codes.
+try:
+    import colorama
+    from colorama import Fore, Style
+except ImportError:
+    if __name__ == "__main__":
+        raise
+    colorama = None
+    Fore = argparse.Namespace(RED="\033[31m", YELLOW="\033[33m", MAGENTA="\033[35m")
+    Style = argparse.Namespace(BRIGHT="\033[1m", RESET_ALL="\033[0m")
 
-# Initialize colorama
-colorama.init()
+# Initialize colorama (it wraps sys.stdout on Windows, which is the importing program's business)
+if __name__ == "__main__":
+    colorama.init()
 
 # Rest of the script continues here...
 # Constants
@@ -78,6 +119,103 @@ WALLETS_DIR = QCLIENT_DIR / "wallets"
 CURRENT_WALLET_FILE = QCLIENT_DIR / ".current_wallet"
 QCLIENT_RELEASE_URL = "https://releases.quilibrium.com/qclient-release"
 QUILIBRIUM_RELEASES = "https://releases.quilibrium.com"
+UPDATE_URL = "https://raw.githubusercontent.com/lamat1111/Q1-Wallet/main/test/python/menu.py"  # same file install.py installs
+UPDATE_STATE_FILE = QCLIENT_DIR / ".update_check.json"
+UPDATE_BODY_FILE = QCLIENT_DIR / ".menu_update.py"  # downloaded newer script, kept until installed
+UPDATE_CHECK_INTERVAL = 6 * 3600
+
+# Metrics settings (set Q1WALLET_METRICS_TEXTFILE to a node-exporter textfile path, e.g. /var/lib/node_exporter/q1wallet.prom)
+METRICS_TEXTFILE = os.environ.get("Q1WALLET_METRICS_TEXTFILE")
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRICS_WINDOW = 500
+METRICS_TEXTFILE_INTERVAL = 5
+
+# Streaming settings: rendered coin lines are flushed in batches of this many lines or this many seconds
+RENDER_BATCH_LINES = 1000
+RENDER_FLUSH_SECONDS = 0.1
+
+# Confirmation settings: after a transfer, merge or split, the wallet is polled every
+# CONFIRM_POLL_SECONDS until the change shows up or CONFIRM_TIMEOUT seconds have passed
+CONFIRM_POLL_SECONDS = 10
+CONFIRM_TIMEOUT = 180
+
+# Dust consolidation settings: coins below DUST_THRESHOLD QUIL are merged in batches of at most DUST_BATCH_SIZE coins
+DUST_THRESHOLD = 0.01
+DUST_BATCH_SIZE = 50
+
+# Locking settings: wallet locks and the coin reservation table are shared by every
+# menu, CLI and cron process using this install directory
+LOCKS_DIR = QCLIENT_DIR / ".locks"
+RESERVATIONS_FILE = QCLIENT_DIR / ".coin_reservations.json"
+WALLET_LOCK_TIMEOUT = 30
+RESERVATION_TTL = CONFIRM_TIMEOUT + 120
+
+# Batch settings: number of qclient calls run in parallel at first, before the adaptive limit takes over
+BATCH_CONCURRENCY = 4
+
+# Adaptive concurrency: qclient processes are started through an AIMD limiter. It starts at BATCH_CONCURRENCY,
+# gains one slot per window of healthy calls up to QCLIENT_CONCURRENCY_MAX, and is cut by CONCURRENCY_BACKOFF
+# on RPC errors, timeouts and on calls slower than CONCURRENCY_LATENCY_FACTOR times the fastest recent call.
+QCLIENT_CONCURRENCY_MAX = 16
+CONCURRENCY_BACKOFF = 0.5
+# A qclient call is killed after QCLIENT_TIMEOUT seconds, a listing once it sends no line for QCLIENT_LINE_TIMEOUT.
+# Both count as an overloaded call for the limiter.
+QCLIENT_TIMEOUT = 120
+QCLIENT_LINE_TIMEOUT = 60
+CONCURRENCY_LATENCY_FACTOR = 3
+CONCURRENCY_WINDOW = 50
+CONCURRENCY_THROUGHPUT_WINDOW = 30
+RPC_OVERLOAD_RE = re.compile(r"deadline exceeded|timed? ?out|unavailable|resource exhausted|too many requests|"
+                             r"rate limit|connection (?:refused|reset)|\b(?:429|502|503|504)\b", re.IGNORECASE)
+
+# Daemon settings: a 'menu.py daemon' process serves wallet state over this Unix socket.
+# Read-only qclient results are shared for DAEMON_CACHE_TTL seconds, coin indexes for DAEMON_INDEX_TTL.
+# Clients give up on a daemon that sends nothing for DAEMON_TIMEOUT seconds (e.g. stuck behind a hung qclient).
+DAEMON_SOCKET = QCLIENT_DIR / ".q1wallet.sock"
+DAEMON_CACHE_TTL = 15
+DAEMON_INDEX_TTL = 60
+DAEMON_TIMEOUT = 300
+DAEMON_CACHED_COMMANDS = {("token", "balance"), ("token", "coins")}
+
+# Wallet registry: cached address and last balance per wallet, rescanned when the wallets directory changes
+WALLET_REGISTRY_FILE = QCLIENT_DIR / ".wallet_registry.json"
+WALLET_PAGE_SIZE = 20
+
+# Balance history: fixed-width (epoch, units) records per wallet and resolution, in HISTORY_DIR/<wallet>/.
+# Raw samples are kept for a week, hourly for 90 days and daily forever.
+HISTORY_DIR = QCLIENT_DIR / "history"
+HISTORY_RECORD = struct.Struct("<qq")
+LEGACY_HISTORY_RECORD = struct.Struct("<qd")  # float amounts, converted on first use
+HISTORY_RESOLUTIONS = (("raw", None, 7 * 86400), ("hourly", 3600, 90 * 86400), ("daily", 86400, None))
+HISTORY_TRIM_SLACK = 86400
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+# Coin snapshots: the last coin listing of each wallet in COIN_SNAPSHOT_DIR/<wallet>.coins, shown right
+# away while the live listing loads. A header (magic, count, time) is followed by the CoinIndex columns
+# in native byte order, so a snapshot is memory-mapped instead of parsed.
+COIN_SNAPSHOT_DIR = QCLIENT_DIR / "snapshots"
+COIN_SNAPSHOT_HEADER = struct.Struct("=8sqd")
+COIN_SNAPSHOT_MAGIC = b"Q1COINS1"
+COIN_REFRESH_TIMEOUT = 120  # seconds to wait for the live listing behind a snapshot
+
+# Shared release cache: qclient release files stored once per host (or per site, on a shared mount) by
+# SHA3-256 digest and hardlinked into each install directory. Set Q1WALLET_RELEASE_CACHE to share it.
+RELEASE_CACHE_DIR = Path(os.environ.get("Q1WALLET_RELEASE_CACHE") or Path.home() / ".cache" / "q1wallet" / "releases")
+FICLONE = 0x40049409  # Linux ioctl to reflink a file on copy-on-write filesystems (btrfs, xfs)
+RELEASE_CACHE_SHARED = bool(os.environ.get("Q1WALLET_RELEASE_CACHE"))
+
+# Qclient release retention: the newest RELEASE_KEEP versions (plus a pinned one) stay installed
+# for instant rollback. The pin and keep count are stored in RELEASE_POLICY_FILE.
+RELEASE_POLICY_FILE = QCLIENT_DIR / ".qclient_releases.json"
+RELEASE_KEEP = 3
+# Results of checking qclient binaries against their .dgst file, keyed by path. An entry is reused
+# while the (size, mtime, inode) of the binary and of its .dgst file are unchanged.
+VERIFY_CACHE_FILE = QCLIENT_DIR / ".qclient_verified.json"
+VERIFY_CHUNK_SIZE = 1024 * 1024
+
+# Profiling settings
+PROFILES_DIR = QCLIENT_DIR / "profiles"
+PROFILE_TOP_N = 25
 
 # Color definitions
 RED = Fore.RED + Style.BRIGHT
@@ -90,6 +228,10 @@ NC = Style.RESET_ALL
 WALLET_NAME = None
 FLAGS = None
 QCLIENT_EXEC = None
+PROFILING = False
+ACTIVE_PROFILE = None
+DAEMON_MODE = False
+COIN_INDEXES = {}
 
 # Helper Functions
 def clear_screen():
@@ -99,11 +241,11 @@ def format_title(title):
     width = len(title) + 8
     return f"\n{BOLD}=== {title} ==={NC}\n{'-' * width}"
 
-def error_message(msg):
-    print(f"{RED}❌ {msg}{NC}")
+def error_message(msg, file=None):
+    print(f"{RED}❌ {msg}{NC}", file=file)
 
-def warning_message(msg):
-    print(f"{ORANGE}⚠️  {msg}{NC}")
+def warning_message(msg, file=None):
+    print(f"{ORANGE}⚠️  {msg}{NC}", file=file)
 
 def confirm_proceed(action_name, description=""):
     print(format_title(action_name))
@@ -121,6 +263,245 @@ def confirm_proceed(action_name, description=""):
 def validate_hash(hash_str):
     return bool(re.match(r"^0x[0-9a-fA-F]{64}$", hash_str))
 
+# Coin Output Parsing
+# Matches "1.000000000000 QUIL (Coin 0x...)" with the optional
+# "Frame 123, Timestamp 2024-01-01T00:00:00Z" suffix printed by 'token coins metadata'
+COIN_LINE_RE = re.compile(r"(\d+\.\d+)\s+QUIL\s+\(Coin\s+(0x[0-9a-fA-F]+)\)(?:\s+Frame\s+(\d+),\s+Timestamp\s+(\S+))?")
+
+QUIL_UNITS = 10 ** 12
+
+def to_units(amount):
+    # Exact for decimal strings such as qclient's 12-decimal amounts. Floats go through their shortest
+    # repr, so typed values like 0.01 convert exactly too.
+    try:
+        return int((Decimal(str(amount)) * QUIL_UNITS).to_integral_value())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {amount}")
+
+def parse_units(text):
+    # "1.000000000000" -> units, for the digits-dot-digits amounts qclient prints
+    whole, frac = text.split(".")
+    return int(whole) * QUIL_UNITS + int(frac[:12].ljust(12, "0"))
+
+def format_units(units):
+    return f"{units // QUIL_UNITS}.{units % QUIL_UNITS:012d}"
+
+def parse_coin_line(line):
+    match = COIN_LINE_RE.search(line)
+    if not match:
+        return None
+    amount, coin_id, frame, timestamp = match.groups()
+    return coin_id, parse_units(amount), int(frame) if frame else None, timestamp
+
+# Coins are (coin_id, units, frame, timestamp), with the amount in exact integer units.
+# The helpers below accept either the full qclient output or an iterable of lines,
+# such as a QclientStream, so large wallets never need to be held in memory
+def iter_lines(coins_output):
+    return coins_output.splitlines() if isinstance(coins_output, str) else coins_output
+
+def parse_coins(coins_output):
+    for line in iter_lines(coins_output):
+        coin = parse_coin_line(line)
+        if coin:
+            yield coin
+
+def count_coins(coins_output):
+    return sum(1 for line in iter_lines(coins_output) if "QUIL" in line)
+
+def parse_balance(balance_output):
+    # "Total balance: 1.000000000000 QUIL (Account 0x...)" -> (units, account)
+    match = re.search(r"(\d+\.\d+)\s+QUIL(?:\s+\(Account\s+(0x[0-9a-fA-F]+)\))?", balance_output or "")
+    if not match:
+        return None, None
+    return parse_units(match.group(1)), match.group(2)
+
+def find_coin_amount(coins_output, coin_id):
+    # Amount of the coin in units, or None
+    for line in iter_lines(coins_output):
+        if coin_id in line:
+            match = re.search(r"(\d+\.\d+)\s+QUIL", line)
+            return parse_units(match.group(1)) if match else None
+    return None
+
+def parse_timestamp(timestamp):
+    try:
+        return calendar.timegm(time.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S"))
+    except (TypeError, ValueError):
+        return 0
+
+def format_timestamp(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+# Coin Index
+# Columnar in-memory index of a wallet's coins, built once per refresh. Coin IDs are
+# packed into a bytearray and amounts (in units), frames and timestamps into typed
+# arrays, so a million coins take a few tens of MB. Sort orders are computed lazily.
+AMOUNT_HISTOGRAM_BOUNDS = (0.001, 0.01, 0.1, 1, 10, 100)
+
+class CoinIndex:
+    ID_SIZE = 32
+
+    def __init__(self):
+        self.ids = bytearray()
+        self.amounts = array("q")
+        self.frames = array("q")
+        self.timestamps = array("q")
+        self.built_at = time.time()
+        self.mapping = None
+        self._orders = {}
+
+    @classmethod
+    def from_coins(cls, coins):
+        index = cls()
+        for coin_id, units, frame, timestamp in coins:
+            index.add(coin_id, units, frame or 0, parse_timestamp(timestamp) if timestamp else 0)
+        return index
+
+    def add(self, coin_id, units, frame, timestamp):
+        self.ids += bytes.fromhex(coin_id[2:].rjust(self.ID_SIZE * 2, "0"))
+        self.amounts.append(units)
+        self.frames.append(frame)
+        self.timestamps.append(timestamp)
+        self._orders.clear()
+
+    def discard(self, coin_ids):
+        # Drops the rows of spent coins, compacting the columns in a single pass
+        rows = {self.find(coin_id) for coin_id in coin_ids} - {None}
+        if not rows:
+            return
+        keep = [i for i in range(len(self)) if i not in rows]
+        size = self.ID_SIZE
+        self.ids = bytearray().join(self.ids[i * size:(i + 1) * size] for i in keep)
+        self.amounts = array("q", (self.amounts[i] for i in keep))
+        self.frames = array("q", (self.frames[i] for i in keep))
+        self.timestamps = array("q", (self.timestamps[i] for i in keep))
+        self._orders.clear()
+
+    def close(self):
+        # Releases the memory map behind a snapshot index; it is empty afterwards
+        if self.mapping is None:
+            return
+        view, data = self.mapping
+        for column in (self.ids, self.amounts, self.frames, self.timestamps, view):
+            column.release()
+        if isinstance(data, mmap.mmap):
+            data.close()
+        self.__init__()
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def coin_id(self, i):
+        return "0x" + self.ids[i * self.ID_SIZE:(i + 1) * self.ID_SIZE].hex()
+
+    def row(self, i):
+        return self.coin_id(i), self.amounts[i], self.frames[i], self.timestamps[i]
+
+    def format_row(self, i, metadata=True):
+        line = f"{format_units(self.amounts[i])} QUIL (Coin {self.coin_id(i)})"
+        if metadata and self.frames[i]:
+            line += f" Frame {self.frames[i]}, Timestamp {format_timestamp(self.timestamps[i])}"
+        return line
+
+    def key_func(self, key):
+        if key == "amount":
+            return self.amounts.__getitem__
+        if key == "frame":
+            return self.frames.__getitem__
+        if key == "id":
+            return lambda i: bytes(self.ids[i * self.ID_SIZE:(i + 1) * self.ID_SIZE])
+        raise ValueError(f"Unknown sort key: {key}")
+
+    def order(self, key):
+        if key not in self._orders:
+            self._orders[key] = array("q", sorted(range(len(self)), key=self.key_func(key)))
+        return self._orders[key]
+
+    def max_frame(self):
+        return max(self.frames) if len(self) else 0
+
+    def find(self, coin_id):
+        # Row index of a coin ID, or None
+        try:
+            key = bytes.fromhex(coin_id[2:].rjust(self.ID_SIZE * 2, "0"))
+        except ValueError:
+            return None
+        rows = self.range_of("id", key, key)
+        return rows[0] if rows else None
+
+    def newer_than(self, frame):
+        # Coins created after the given frame, oldest first
+        return self.range_of("frame", frame + 1)
+
+    def range_of(self, key, low=None, high=None):
+        # Row indices whose key lies in [low, high], in ascending key order
+        order = self.order(key)
+        get = self.key_func(key)
+        start = 0 if low is None else bisect_order(order, get, low, left=True)
+        end = len(order) if high is None else bisect_order(order, get, high, left=False)
+        return order[start:end]
+
+    def query(self, sort="amount", descending=False, min_amount=None, max_amount=None,
+              id_prefix=None, top=None, bottom=None):
+        candidates = None
+        candidates_key = None
+        if min_amount is not None or max_amount is not None:
+            candidates = self.range_of("amount",
+                                       None if min_amount is None else to_units(min_amount),
+                                       None if max_amount is None else to_units(max_amount))
+            candidates_key = "amount"
+        if id_prefix:
+            prefix = id_prefix.lower()[2:] if id_prefix.lower().startswith("0x") else id_prefix.lower()
+            low = bytes.fromhex(prefix.ljust(self.ID_SIZE * 2, "0"))
+            high = bytes.fromhex(prefix.ljust(self.ID_SIZE * 2, "f"))
+            by_prefix = self.range_of("id", low, high)
+            if candidates is None:
+                candidates, candidates_key = by_prefix, "id"
+            else:
+                wanted = set(by_prefix)
+                candidates = [i for i in candidates if i in wanted]
+        if candidates is None:
+            rows = list(self.order(sort))
+        elif candidates_key == sort:
+            rows = list(candidates)
+        else:
+            rows = sorted(candidates, key=self.key_func(sort))
+        if descending:
+            rows.reverse()
+        if top:
+            rows = rows[:top]
+        elif bottom:
+            rows = rows[-bottom:]
+        return rows
+
+    def total(self, rows=None):
+        if rows is None:
+            return sum(self.amounts)
+        return sum(self.amounts[i] for i in rows)
+
+    def histogram(self, rows=None):
+        bounds = [to_units(b) for b in AMOUNT_HISTOGRAM_BOUNDS]
+        counts = [0] * (len(bounds) + 1)
+        amounts = self.amounts if rows is None else (self.amounts[i] for i in rows)
+        for units in amounts:
+            counts[bisect.bisect_right(bounds, units)] += 1
+        labels = [f"< {AMOUNT_HISTOGRAM_BOUNDS[0]}"]
+        labels += [f"{low} - {high}" for low, high in zip(AMOUNT_HISTOGRAM_BOUNDS, AMOUNT_HISTOGRAM_BOUNDS[1:])]
+        labels.append(f">= {AMOUNT_HISTOGRAM_BOUNDS[-1]}")
+        return list(zip(labels, counts))
+
+def bisect_order(order, get, value, left=True):
+    # bisect over a sort order (array of row indices) using the row key
+    lo, hi = 0, len(order)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        key = get(order[mid])
+        if key < value or (not left and key == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
 def wait_with_spinner(message, seconds):
     chars = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
     stop_event = threading.Event()
@@ -147,9 +528,8 @@ def wait_with_spinner(message, seconds):
     thread.join()
     signal.signal(signal.SIGINT, signal.SIG_DFL)
 
-def get_config_flags():
-    global WALLET_NAME
-    return [f"--config", str(WALLETS_DIR / WALLET_NAME / ".config"), "--public-rpc"]
+def get_config_flags(wallet=None):
+    return [f"--config", str(WALLETS_DIR / (wallet or WALLET_NAME) / ".config"), "--public-rpc"]
 
 def setup_initial_wallet():
     global WALLET_NAME, FLAGS
@@ -167,6 +547,1081 @@ def setup_initial_wallet():
             f.write(WALLET_NAME)
     FLAGS = get_config_flags()
 
+# Metrics
+def call_failed(kind, code):
+    # HTTP calls fail outside 2xx/3xx (-1 when no response arrived), qclient calls on any non-zero exit code
+    if kind == "http":
+        return not 200 <= code < 400
+    return code != 0
+
+class Metrics:
+    def __init__(self, textfile=None):
+        self.textfile = textfile
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.written_at = 0.0
+        self.histograms = {}
+        self.recent = collections.deque(maxlen=METRICS_WINDOW)
+        if textfile:
+            atexit.register(self.flush)
+
+    def record(self, kind, command, wallet, duration, code, size):
+        with self.lock:
+            self.recent.append((time.time(), kind, command, wallet, duration, code, size))
+            key = (kind, command, wallet or "")
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": [0] * len(METRICS_BUCKETS), "sum": 0.0, "count": 0, "failures": 0, "bytes": 0}
+            for i, bound in enumerate(METRICS_BUCKETS):
+                if duration <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += duration
+            hist["count"] += 1
+            hist["bytes"] += size
+            if call_failed(kind, code):
+                hist["failures"] += 1
+        if self.textfile and time.time() - self.written_at >= METRICS_TEXTFILE_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        try:
+            self.write_textfile()
+        except OSError:
+            pass
+
+    def summary(self):
+        # Rolling latency over the last METRICS_WINDOW calls, grouped by kind and command
+        with self.lock:
+            samples = list(self.recent)
+        groups = {}
+        for _, kind, command, _, duration, code, size in samples:
+            groups.setdefault((kind, command), []).append((duration, code, size))
+        rows = []
+        for (kind, command), values in sorted(groups.items()):
+            durations = sorted(v[0] for v in values)
+            failures = sum(1 for v in values if call_failed(kind, v[1]))
+            rows.append({
+                "kind": kind,
+                "command": command,
+                "calls": len(values),
+                "failures": failures,
+                "p50": durations[len(durations) // 2],
+                "p95": durations[min(int(len(durations) * 0.95), len(durations) - 1)],
+                "max": durations[-1],
+                "bytes": sum(v[2] for v in values),
+            })
+        return rows
+
+    def render_prometheus(self):
+        def label(value):
+            return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        lines = []
+        with self.lock:
+            items = sorted(self.histograms.items())
+        for kind in sorted({key[0] for key, _ in items}):
+            name = f"q1wallet_{kind}_duration_seconds"
+            lines.append(f"# HELP {name} Duration of {kind} calls made by the Q1 Wallet.")
+            lines.append(f"# TYPE {name} histogram")
+            for (k, command, wallet), hist in items:
+                if k != kind:
+                    continue
+                labels = f'command="{label(command)}",wallet="{label(wallet)}"'
+                for bound, count in zip(METRICS_BUCKETS, hist["buckets"]):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist["count"]}')
+                lines.append(f"{name}_sum{{{labels}}} {hist['sum']:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {hist['count']}")
+            for suffix, field, help_text in (("failures_total", "failures", "Failed"), ("output_bytes_total", "bytes", "Output bytes of")):
+                metric = f"q1wallet_{kind}_{suffix}"
+                lines.append(f"# HELP {metric} {help_text} {kind} calls made by the Q1 Wallet.")
+                lines.append(f"# TYPE {metric} counter")
+                for (k, command, wallet), hist in items:
+                    if k == kind:
+                        lines.append(f'{metric}{{command="{label(command)}",wallet="{label(wallet)}"}} {hist[field]}')
+        stats = QCLIENT_LIMITER.stats()
+        for metric, value, help_text in (("q1wallet_qclient_concurrency_limit", stats["limit"], "Current adaptive limit of parallel qclient calls."),
+                                         ("q1wallet_qclient_throughput", f"{stats['throughput']:.3f}", "Completed qclient calls per second.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self):
+        # Write to a temporary file and rename, so node-exporter never reads a partial file.
+        # Writes are serialized, so an older rendering never replaces a newer one.
+        path = Path(self.textfile)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with self.write_lock:
+            self.written_at = time.time()
+            with open(tmp, "w") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp, path)
+
+METRICS = Metrics(METRICS_TEXTFILE)
+
+class ConcurrencyLimiter:
+    # Additive increase, multiplicative decrease, as in TCP congestion control. Latency is judged per
+    # command, since a merge is always slower than a balance check.
+    def __init__(self, initial, maximum, minimum=1):
+        self.cond = threading.Condition()
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.latencies = {}
+        self.completions = collections.deque()
+        self.started = None
+        self.last_decrease = 0.0
+        self.holders = collections.Counter()
+
+    @contextlib.contextmanager
+    def slot(self, command):
+        # Holds a slot for the lifetime of one qclient process. The caller fills in the yielded
+        # LimiterSlot; leaving with an exception counts as overloaded. A generator closed early
+        # (GeneratorExit) is a normal exit, and may happen on any thread.
+        owner = self.acquire()
+        slot = LimiterSlot()
+        failed = True
+        try:
+            yield slot
+            failed = False
+        except GeneratorExit:
+            failed = False
+            raise
+        finally:
+            self.release(owner, command, slot.duration, failed or slot.overloaded)
+
+    def acquire(self):
+        # A thread that already holds a slot (e.g. a call made while reading a QclientStream) is not
+        # gated again, so nested calls can never wait on themselves. Returns the owner for release().
+        owner = threading.get_ident()
+        with self.cond:
+            if not self.holders[owner]:
+                while self.in_flight >= int(self.limit):
+                    self.cond.wait()
+            self.holders[owner] += 1
+            self.in_flight += 1
+            if self.started is None:
+                self.started = time.monotonic()
+        return owner
+
+    def release(self, owner, command, duration=None, overloaded=False):
+        # duration is None for calls whose time depends on the output size, such as coin listings
+        now = time.monotonic()
+        with self.cond:
+            self.holders[owner] -= 1
+            if not self.holders[owner]:
+                del self.holders[owner]
+            self.in_flight -= 1
+            self.completions.append(now)
+            while now - self.completions[0] > CONCURRENCY_THROUGHPUT_WINDOW:
+                self.completions.popleft()
+            recent = self.latencies.setdefault(command, collections.deque(maxlen=CONCURRENCY_WINDOW))
+            baseline = min(recent) if recent else None
+            if duration is not None:
+                recent.append(duration)
+            slow = baseline is not None and duration is not None and duration > baseline * CONCURRENCY_LATENCY_FACTOR
+            if overloaded or slow:
+                # At most one cut per round trip, the calls already running saw the same congestion
+                if now - self.last_decrease > (baseline or 0):
+                    self.limit = max(self.minimum, self.limit * CONCURRENCY_BACKOFF)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            elapsed = min(CONCURRENCY_THROUGHPUT_WINDOW, time.monotonic() - self.started) if self.started else 0
+            return {"limit": int(self.limit), "maximum": self.maximum, "in_flight": self.in_flight,
+                    "throughput": len(self.completions) / elapsed if elapsed > 0 else 0.0}
+
+class LimiterSlot:
+    def __init__(self):
+        self.duration = None
+        self.overloaded = False
+
+QCLIENT_LIMITER = ConcurrencyLimiter(BATCH_CONCURRENCY, QCLIENT_CONCURRENCY_MAX)
+
+def run_parallel(func, items, concurrency=None):
+    # Yields func(item) for each item as the calls complete. With a fixed concurrency that many run at
+    # once; otherwise as many as QCLIENT_LIMITER currently allows, so worker threads are only started
+    # as the limit grows, instead of QCLIENT_CONCURRENCY_MAX of them queueing on it from the start.
+    items = iter(items)
+    pending = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency or QCLIENT_LIMITER.maximum)) as pool:
+        while True:
+            width = concurrency or QCLIENT_LIMITER.stats()["limit"]
+            for item in itertools.islice(items, max(0, width - len(pending))):
+                pending.add(pool.submit(func, item))
+            if not pending:
+                return
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def format_concurrency(stats):
+    return (f"Qclient concurrency: limit {stats['limit']} of {stats['maximum']}, {stats['in_flight']} running, "
+            f"{stats['throughput']:.1f} calls/s")
+
+def rpc_overloaded(result):
+    return result.returncode != 0 and bool(RPC_OVERLOAD_RE.search(f"{result.stderr or ''}\n{result.stdout or ''}"))
+
+# Qclient Execution
+def qclient_command(args, wallet=None):
+    return [str(QCLIENT_EXEC)] + args + get_config_flags(wallet)
+
+def run_qclient(args, wallet=None):
+    wallet = wallet or WALLET_NAME
+    start = time.perf_counter()
+    try:
+        response = daemon_request("run", args=args, wallet=wallet)
+        METRICS.record("daemon", " ".join(args[:2]), wallet, time.perf_counter() - start,
+                       response["returncode"], len(response["stdout"]) + len(response["stderr"]))
+        return subprocess.CompletedProcess(args, response["returncode"], response["stdout"], response["stderr"])
+    except DaemonUnavailable:
+        pass
+    except RuntimeError as e:
+        # The daemon got the request but did not answer, so the command must not run a second time here
+        METRICS.record("daemon", " ".join(args[:2]), wallet, time.perf_counter() - start, -1, 0)
+        return subprocess.CompletedProcess(args, -1, "", str(e))
+    with QCLIENT_LIMITER.slot(" ".join(args[:2])) as slot:
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(qclient_command(args, wallet), text=True, capture_output=True, timeout=QCLIENT_TIMEOUT)
+            slot.overloaded = rpc_overloaded(result)
+        except subprocess.TimeoutExpired:
+            result = subprocess.CompletedProcess(args, -1, "", f"qclient {' '.join(args[:2])} timed out after {QCLIENT_TIMEOUT}s")
+            slot.overloaded = True
+        slot.duration = time.perf_counter() - start
+    METRICS.record("qclient", " ".join(args[:2]), wallet, slot.duration,
+                   result.returncode, len(result.stdout or "") + len(result.stderr or ""))
+    return result
+
+class QclientStream:
+    # Iterates over qclient stdout line by line while the command is still running.
+    # stderr goes to a temporary file so a chatty stderr can never block the stdout pipe.
+    # Coin listings come from the daemon's warm index when a daemon runs; refresh asks it for a live listing.
+    def __init__(self, args, wallet=None, refresh=False):
+        self.args = args
+        self.wallet = wallet or WALLET_NAME
+        self.refresh = refresh
+        self.returncode = None
+        self.stderr = ""
+        self.output_bytes = 0
+
+    def __iter__(self):
+        if tuple(self.args[:2]) == ("token", "coins"):
+            try:
+                lines = daemon_stream("listing", args=self.args, wallet=self.wallet, refresh=self.refresh)
+            except DaemonUnavailable:
+                lines = None
+            except RuntimeError as e:
+                self.returncode, self.stderr = 1, str(e)
+                return
+            if lines is not None:
+                yield from self.read_daemon(lines)
+                return
+        yield from self.read_qclient()
+
+    def read_daemon(self, lines):
+        start = time.perf_counter()
+        trailer = None
+        try:
+            while True:
+                try:
+                    line = next(lines)
+                except StopIteration as stop:
+                    trailer = stop.value
+                    break
+                self.output_bytes += len(line)
+                yield line
+        finally:
+            # Stopping early closes the connection, the daemon then drops the rest of the listing
+            lines.close()
+            self.returncode, self.stderr = (trailer["returncode"], trailer["stderr"]) if trailer else (0, "")
+            METRICS.record("daemon", " ".join(self.args[:2]), self.wallet, time.perf_counter() - start,
+                           self.returncode, self.output_bytes + len(self.stderr))
+
+    def read_qclient(self):
+        # The limiter slot is held exactly as long as the process runs, also when the consumer stops early
+        with QCLIENT_LIMITER.slot(" ".join(self.args[:2])) as slot, tempfile.TemporaryFile(mode="w+") as stderr_file:
+            start = time.perf_counter()
+            proc = subprocess.Popen(qclient_command(self.args, self.wallet), text=True,
+                                    stdout=subprocess.PIPE, stderr=stderr_file, bufsize=1)
+            # reading[0] is when the pending readline() started, None while the consumer has the line, so a
+            # slow consumer never counts against qclient. The watchdog kills a silent qclient, which ends the loop.
+            reading, done, timed_out = [None], threading.Event(), threading.Event()
+            def watchdog():
+                while not done.wait(min(1, QCLIENT_LINE_TIMEOUT)):
+                    if reading[0] is not None and time.monotonic() - reading[0] > QCLIENT_LINE_TIMEOUT:
+                        timed_out.set()
+                        proc.kill()
+                        return
+            threading.Thread(target=watchdog, daemon=True).start()
+            stopped_early = False
+            try:
+                while True:
+                    reading[0] = time.monotonic()
+                    line = proc.stdout.readline()
+                    reading[0] = None
+                    if not line:
+                        break
+                    self.output_bytes += len(line)
+                    yield line.rstrip("\n")
+            finally:
+                done.set()
+                if proc.poll() is None:
+                    # The consumer stopped early (e.g. the coin was found), no need to read the rest
+                    stopped_early = True
+                    proc.kill()
+                proc.stdout.close()
+                self.returncode = 0 if stopped_early else proc.wait()
+                proc.wait()
+                stderr_file.seek(0)
+                self.stderr = stderr_file.read()
+                if timed_out.is_set():
+                    self.returncode = -1
+                    self.stderr = f"qclient {' '.join(self.args[:2])} sent nothing for {QCLIENT_LINE_TIMEOUT}s\n{self.stderr}".strip()
+                slot.overloaded = timed_out.is_set() or (self.returncode != 0 and bool(RPC_OVERLOAD_RE.search(self.stderr)))
+                METRICS.record("qclient", " ".join(self.args[:2]), self.wallet, time.perf_counter() - start,
+                               self.returncode, self.output_bytes + len(self.stderr))
+
+def render_lines(lines, out=None):
+    out = out or sys.stdout
+    batch = []
+    last_flush = time.monotonic()
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= RENDER_BATCH_LINES or time.monotonic() - last_flush >= RENDER_FLUSH_SECONDS:
+            out.write("\n".join(batch) + "\n")
+            out.flush()
+            batch = []
+            last_flush = time.monotonic()
+        yield line
+    if batch:
+        out.write("\n".join(batch) + "\n")
+        out.flush()
+
+def http_get(url, command, **kwargs):
+    import requests
+    start = time.perf_counter()
+    try:
+        response = requests.get(url, **kwargs)
+    except Exception:
+        METRICS.record("http", command, None, time.perf_counter() - start, -1, 0)
+        raise
+    METRICS.record("http", command, None, time.perf_counter() - start, response.status_code, len(response.content))
+    return response
+
+# Wallet Locks and Coin Reservations
+def lock_file(f, blocking=True):
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+def unlock_file(f):
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextlib.contextmanager
+def file_lock(path, timeout=None, busy_message=None):
+    # Advisory lock on a file, held until the block exits. With a timeout, gives up with RuntimeError.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+") as f:
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                lock_file(f, blocking=deadline is None)
+                break
+            except OSError:
+                # Without a deadline this only happens on Windows, whose blocking lock gives up after ~10 s
+                if deadline is not None and time.time() >= deadline:
+                    raise RuntimeError(busy_message or f"{path.name} is locked by another process")
+                time.sleep(0.2)
+        try:
+            yield
+        finally:
+            unlock_file(f)
+
+def wallet_key(wallet=None):
+    # Wallet locks and reservations are keyed by the resolved .config path, so the menu and a WalletClient
+    # agree on a wallet, while equally named wallets in other directories stay apart. wallet is a menu
+    # wallet name, or the absolute .config path a WalletClient passes.
+    wallet = wallet or WALLET_NAME
+    path = Path(wallet) if os.path.isabs(wallet) else WALLETS_DIR / wallet / ".config"
+    return str(path.resolve())
+
+def wallet_lock(wallet=None, timeout=WALLET_LOCK_TIMEOUT):
+    wallet = wallet or WALLET_NAME
+    digest = hashlib.sha256(wallet_key(wallet).encode()).hexdigest()[:16]
+    return file_lock(LOCKS_DIR / f"wallet-{digest}.lock", timeout,
+                     f"Wallet '{wallet}' is busy with an operation in another process. Try again later.")
+
+def update_reservations(func):
+    # Read-modify-write of the reservation table under its lock; expired entries are dropped.
+    # The file is only rewritten when func or the expiry changed something, so reads stay reads.
+    with file_lock(LOCKS_DIR / "reservations.lock"):
+        try:
+            with open(RESERVATIONS_FILE) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = {}
+        now = time.time()
+        table = {
+            "coins": {k: v for k, v in stored.get("coins", {}).items() if v["expires"] > now},
+            "wallets": {k: v for k, v in stored.get("wallets", {}).items() if v["expires"] > now},
+        }
+        before = {key: dict(entries) for key, entries in table.items()}
+        result = func(table, now)
+        if table != stored or table != before:
+            tmp = RESERVATIONS_FILE.with_name(f".{RESERVATIONS_FILE.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(table, f)
+            os.replace(tmp, RESERVATIONS_FILE)
+        return result
+
+def reserved_coins(wallet=None):
+    # (reserved coin IDs, whether the whole wallet is reserved)
+    wallet = wallet_key(wallet)
+    def read(table, now):
+        coins = {c for c, entry in table["coins"].items() if entry["wallet"] == wallet}
+        return coins, wallet in table["wallets"]
+    return update_reservations(read)
+
+def reserve_coins(coin_ids, wallet=None, ttl=RESERVATION_TTL):
+    # Reserves the coins that are free and returns them; coins held by others are skipped
+    wallet = wallet_key(wallet)
+    def reserve(table, now):
+        if wallet in table["wallets"]:
+            return []
+        granted = []
+        for coin_id in (c.lower() for c in coin_ids):
+            if coin_id not in table["coins"]:
+                table["coins"][coin_id] = {"wallet": wallet, "pid": os.getpid(), "expires": now + ttl}
+                granted.append(coin_id)
+        return granted
+    return update_reservations(reserve)
+
+def reserve_wallet(wallet=None, ttl=RESERVATION_TTL):
+    # Reserves every coin of the wallet (e.g. for 'merge all'); fails if any coin is already reserved
+    wallet = wallet_key(wallet)
+    def reserve(table, now):
+        if wallet in table["wallets"] or any(e["wallet"] == wallet for e in table["coins"].values()):
+            return False
+        table["wallets"][wallet] = {"wallet": wallet, "pid": os.getpid(), "expires": now + ttl}
+        return True
+    return update_reservations(reserve)
+
+def release_coins(coin_ids=(), wallet=None, whole_wallet=False):
+    wallet = wallet_key(wallet)
+    def release(table, now):
+        for coin_id in coin_ids:
+            table["coins"].pop(coin_id.lower(), None)
+        if whole_wallet:
+            table["wallets"].pop(wallet, None)
+    update_reservations(release)
+
+def submit_spend(args, coin_ids, wallet=None, run=None):
+    # Runs a qclient command that spends the given coins, unless another process has reserved them.
+    # The coins stay reserved until confirmed (or RESERVATION_TTL), so concurrent planners skip them.
+    # run defaults to run_qclient; WalletClient passes its own runner.
+    with wallet_lock(wallet):
+        granted = reserve_coins(coin_ids, wallet)
+        if len(granted) < len(set(c.lower() for c in coin_ids)):
+            release_coins(granted, wallet)
+            raise RuntimeError("Coin is reserved by another operation in progress. Try again later.")
+        result = (run or run_qclient)(args, wallet)
+        if result.returncode != 0:
+            release_coins(granted, wallet)
+        invalidate_daemon_cache(wallet)
+        return result
+
+def submit_merge_all(wallet=None, run=None):
+    with wallet_lock(wallet):
+        if not reserve_wallet(wallet):
+            raise RuntimeError("Some coins of this wallet are reserved by another operation in progress. Try again later.")
+        result = (run or run_qclient)(["token", "merge", "all"], wallet)
+        if result.returncode != 0:
+            release_coins(wallet=wallet, whole_wallet=True)
+        invalidate_daemon_cache(wallet)
+        return result
+
+# Wallet Registry
+# {"dir_mtime": ns, "wallets": {name: {"address": ..., "balance": ..., "refreshed": epoch}}}
+# Creating or deleting a wallet changes the mtime of WALLETS_DIR, which is the only time it is listed again.
+def update_wallet_registry(func=None):
+    with file_lock(LOCKS_DIR / "registry.lock"):
+        try:
+            with open(WALLET_REGISTRY_FILE) as f:
+                registry = json.load(f)
+        except (OSError, ValueError):
+            registry = {}
+        wallets = registry.get("wallets", {})
+        dir_mtime = WALLETS_DIR.stat().st_mtime_ns if WALLETS_DIR.exists() else 0
+        # Folders without a .config yet don't change the mtime of WALLETS_DIR once it appears
+        # (e.g. when importing a wallet), so they are checked on every call until they do
+        pending = registry.get("pending", [])
+        changed = registry.get("dir_mtime") != dir_mtime or any((WALLETS_DIR / d / ".config").exists() for d in pending)
+        if changed:
+            dirs = [d for d in WALLETS_DIR.iterdir() if d.is_dir()] if dir_mtime else []
+            names = sorted(d.name for d in dirs if (d / ".config").exists())
+            pending = sorted(d.name for d in dirs if d.name not in names)
+            wallets = {name: wallets.get(name, {}) for name in names}
+        registry = {"dir_mtime": dir_mtime, "pending": pending, "wallets": wallets}
+        result = func(registry) if func else None
+        if changed or func:
+            tmp = WALLET_REGISTRY_FILE.with_name(f".{WALLET_REGISTRY_FILE.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(registry, f)
+            os.replace(tmp, WALLET_REGISTRY_FILE)
+        return registry if func is None else result
+
+def wallet_registry():
+    return update_wallet_registry()["wallets"]
+
+def record_wallet_balance(wallet, units, account):
+    def record(registry):
+        if wallet in registry["wallets"]:
+            registry["wallets"][wallet].update(address=account, balance=format_units(units), refreshed=time.time())
+    update_wallet_registry(record)
+    BalanceHistory(wallet).append(units)
+
+# Balance History
+# Every resolution is a sorted array of HISTORY_RECORD entries, so range queries are a binary search over
+# a memory-mapped file. Downsampling happens on append: the last hourly and daily records are overwritten
+# in place while the sample falls in the same bucket, so they always hold the latest balance of their bucket.
+class BalanceHistory:
+    def __init__(self, wallet):
+        self.wallet = wallet
+        self.dir = HISTORY_DIR / wallet
+
+    def path(self, resolution):
+        return self.dir / f"{resolution}.units.bin"
+
+    def migrate(self, resolution):
+        # Earlier versions stored float amounts in <resolution>.bin; they are converted to units once.
+        # Called with the history lock held.
+        legacy = self.dir / f"{resolution}.bin"
+        path = self.path(resolution)
+        if path.exists() or not legacy.exists():
+            return
+        data = legacy.read_bytes()
+        size = LEGACY_HISTORY_RECORD.size
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            for offset in range(0, len(data) - len(data) % size, size):
+                ts, amount = LEGACY_HISTORY_RECORD.unpack_from(data, offset)
+                f.write(HISTORY_RECORD.pack(ts, to_units(amount)))
+        os.replace(tmp, path)
+        legacy.unlink()
+
+    def append(self, units, ts=None):
+        ts = int(ts or time.time())
+        with file_lock(LOCKS_DIR / f"history-{self.wallet}.lock"):
+            self.dir.mkdir(parents=True, exist_ok=True)
+            for resolution, bucket, keep in HISTORY_RESOLUTIONS:
+                self.migrate(resolution)
+                path = self.path(resolution)
+                self.upsert(path, ts, units, bucket)
+                if keep:
+                    self.trim(path, ts - keep)
+
+    def upsert(self, path, ts, units, bucket):
+        size = HISTORY_RECORD.size
+        with open(path, "r+b" if path.exists() else "w+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            end -= end % size  # drop a partial record left by an interrupted write
+            if end:
+                f.seek(end - size)
+                last_ts, _ = HISTORY_RECORD.unpack(f.read(size))
+                if ts < last_ts:
+                    return  # clock went backwards, keep the series sorted
+                if bucket and last_ts // bucket == ts // bucket:
+                    end -= size
+            f.seek(end)
+            f.write(HISTORY_RECORD.pack(ts, units))
+            f.truncate()
+
+    def trim(self, path, cutoff):
+        # Rewrites the file without records older than cutoff, at most once per HISTORY_TRIM_SLACK
+        with open(path, "rb") as f:
+            first = f.read(HISTORY_RECORD.size)
+        if len(first) < HISTORY_RECORD.size or HISTORY_RECORD.unpack(first)[0] >= cutoff - HISTORY_TRIM_SLACK:
+            return
+        data = path.read_bytes()
+        with memoryview(data) as view:
+            start = self.search(view, cutoff) * HISTORY_RECORD.size
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data[start:len(data) - len(data) % HISTORY_RECORD.size])
+        os.replace(tmp, path)
+
+    @staticmethod
+    def search(buffer, ts):
+        # Index of the first record at or after ts
+        lo, hi = 0, len(buffer) // HISTORY_RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if HISTORY_RECORD.unpack_from(buffer, mid * HISTORY_RECORD.size)[0] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def resolution_for(self, start):
+        # The finest resolution that still covers the start of the range
+        now = time.time()
+        for resolution, _, keep in HISTORY_RESOLUTIONS:
+            if keep is None or start >= now - keep:
+                return resolution
+
+    def query(self, start, end=None, resolution=None):
+        # [(epoch, units)] in the range
+        resolution = resolution or self.resolution_for(start)
+        if (self.dir / f"{resolution}.bin").exists():
+            with file_lock(LOCKS_DIR / f"history-{self.wallet}.lock"):
+                self.migrate(resolution)
+        path = self.path(resolution)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            if os.fstat(f.fileno()).st_size < HISTORY_RECORD.size:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                first = self.search(data, start)
+                last = self.search(data, end + 1) if end is not None else len(data) // HISTORY_RECORD.size
+                return [HISTORY_RECORD.unpack_from(data, i * HISTORY_RECORD.size) for i in range(first, last)]
+
+def sparkline(values, width=30):
+    if len(values) > width:
+        values = [values[(i + 1) * len(values) // width - 1] for i in range(width)]
+    if not values:
+        return ""
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2] * len(values)
+    return "".join(SPARK_CHARS[int((v - lo) / (hi - lo) * (len(SPARK_CHARS) - 1))] for v in values)
+
+def format_history(wallet, days=30, width=30):
+    samples = BalanceHistory(wallet).query(time.time() - days * 86400)
+    if len(samples) < 2:
+        return None
+    values = [units for _, units in samples]
+    first, last = (Decimal(v).scaleb(-12) for v in (values[0], values[-1]))
+    return f"{sparkline(values, width)}  {first:.4f} → {last:.4f} QUIL ({last - first:+.4f})"
+
+def format_age(seconds):
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)}{unit} ago"
+    return "just now"
+
+def format_registry_entry(name, entry):
+    address = entry.get("address")
+    address = f"{address[:8]}…{address[-6:]}" if address else "address unknown"
+    if entry.get("balance") is None:
+        return f"{name:<24} {address}"
+    age = format_age(time.time() - entry["refreshed"])
+    # Older registries stored the balance as a float
+    return f"{name:<24} {address}  {Decimal(str(entry['balance'])):.4f} QUIL ({age})"
+
+def pick_wallet(action):
+    # Paged wallet list with incremental search. Returns the selected name, or None on exit.
+    registry = wallet_registry()
+    names = list(registry)
+    if not names:
+        return None
+    haystack = {name: f"{name} {registry[name].get('address') or ''}".lower() for name in names}
+    query, matches, page = "", names, 0
+    while True:
+        pages = max(1, -(-len(matches) // WALLET_PAGE_SIZE))
+        page = min(page, pages - 1)
+        shown = matches[page * WALLET_PAGE_SIZE:(page + 1) * WALLET_PAGE_SIZE]
+        title = f"Wallets matching '{query}'" if query else "Available wallets"
+        print(f"\n{title} ({len(matches)} of {len(names)}, page {page + 1}/{pages}):\n" + "-" * 40)
+        for i, name in enumerate(shown, 1):
+            suffix = " (current)" if name == WALLET_NAME else ""
+            print(f"{i:>2}) {format_registry_entry(name, registry[name])}{suffix}")
+        selection = input(f"\nWallet number to {action}, text to search, '/' to clear, 'n'/'p' next/previous page, "
+                          f"'r' to refresh balances, or 'e' to exit: ").strip()
+        if selection.lower() == 'e':
+            return None
+        if selection.lower() == 'n':
+            page += 1
+        elif selection.lower() == 'p':
+            page = max(0, page - 1)
+        elif selection == '/':
+            query, matches, page = "", names, 0
+        elif selection.lower() == 'r':
+            print(f"Refreshing {len(shown)} wallets...")
+            run_batch("balance", shown)
+            registry = wallet_registry()
+            haystack.update({name: f"{name} {registry[name].get('address') or ''}".lower() for name in shown})
+        elif selection.isdigit():
+            if 1 <= int(selection) <= len(shown):
+                return shown[int(selection) - 1]
+            error_message(f"Invalid selection. Choose 1-{len(shown)}")
+        elif selection:
+            text = selection.lower()
+            # Refining the previous search only needs to look at its matches
+            pool = matches if query and text.startswith(query) else names
+            query, matches, page = text, [n for n in pool if text in haystack[n]], 0
+            if not matches:
+                error_message(f"No wallet matches '{selection}'")
+
+# Library API
+# WalletClient talks to qclient for one wallet without touching the menu globals, so other tools can
+# 'import menu' and drive any number of wallets concurrently:
+#
+#   client = menu.WalletClient("~/q1wallet/wallets/Wallet_1/.config", "~/q1wallet/qclient-2.1.0-linux-amd64")
+#   print(client.balance().amount, len(client.coins()))
+#
+# Importing needs requests and colorama installed, but does not install them or change sys.stdout.
+# Spends take the same wallet lock and coin reservations as the menu, keyed by the resolved .config path, so
+# a client and a running menu never submit the same coin twice. The reservations of a spend are released
+# by confirm() once its coins are gone, by release(), or expire after RESERVATION_TTL.
+class Coin(NamedTuple):
+    id: str
+    amount: Decimal  # exact, e.g. Decimal("1.500000000000")
+    frame: int = None
+    timestamp: str = None
+
+class Balance(NamedTuple):
+    amount: Decimal  # exact, like Coin.amount
+    account: str
+
+class SpendResult(NamedTuple):
+    command: str
+    coin_ids: tuple
+    output: str
+    whole_wallet: bool = False  # 'merge all', which reserves the whole wallet
+
+class WalletClient:
+    def __init__(self, config_dir, qclient_path, name=None, public_rpc=True, timeout=QCLIENT_TIMEOUT):
+        self.config_dir = Path(config_dir).expanduser().resolve()
+        self.qclient_path = Path(qclient_path).expanduser().resolve()
+        self.name = name or self.config_dir.parent.name
+        self.public_rpc = public_rpc
+        self.timeout = timeout
+        if not self.qclient_path.is_file():
+            raise FileNotFoundError(f"Qclient binary not found: {self.qclient_path}")
+
+    def command(self, args):
+        return [str(self.qclient_path)] + args + ["--config", str(self.config_dir)] + (["--public-rpc"] if self.public_rpc else [])
+
+    def run(self, args):
+        # Raises RuntimeError with qclient's error output when the command fails
+        return self.check(self.execute(args))
+
+    def check(self, result):
+        if result.returncode != 0:
+            raise RuntimeError((result.stderr or result.stdout).strip() or f"qclient exited with code {result.returncode}")
+        return result.stdout
+
+    def execute(self, args, wallet=None):
+        # Same signature as run_qclient, so submit_spend and submit_merge_all can run it
+        with QCLIENT_LIMITER.slot(" ".join(args[:2])) as slot:
+            start = time.perf_counter()
+            try:
+                result = subprocess.run(self.command(args), text=True, capture_output=True, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                slot.duration = time.perf_counter() - start
+                slot.overloaded = True
+                METRICS.record("qclient", " ".join(args[:2]), self.name, slot.duration, -1, 0)
+                raise RuntimeError(f"qclient {' '.join(args[:2])} timed out after {self.timeout}s")
+            slot.duration = time.perf_counter() - start
+            slot.overloaded = rpc_overloaded(result)
+        METRICS.record("qclient", " ".join(args[:2]), self.name, slot.duration,
+                       result.returncode, len(result.stdout or "") + len(result.stderr or ""))
+        return result
+
+    def balance(self):
+        units, account = parse_balance(self.run(["token", "balance"]))
+        if units is None:
+            raise RuntimeError("Could not parse the balance output")
+        return Balance(Decimal(units).scaleb(-12), account)
+
+    def coins(self, metadata=False):
+        output = self.run(["token", "coins", "metadata"] if metadata else ["token", "coins"])
+        return [Coin(coin_id, Decimal(units).scaleb(-12), frame, timestamp)
+                for coin_id, units, frame, timestamp in parse_coins(output)]
+
+    def coin_index(self):
+        return CoinIndex.from_coins(parse_coins(self.run(["token", "coins", "metadata"])))
+
+    def spend(self, args, coin_ids):
+        # Raises RuntimeError when a coin is reserved by another operation; coin_ids None spends the whole
+        # wallet. The coins stay reserved until confirm() or release(), or for RESERVATION_TTL.
+        key = str(self.config_dir)
+        if coin_ids is None:
+            coin_ids = [coin.id for coin in self.coins()]
+            result = submit_merge_all(key, run=self.execute)
+            whole_wallet = True
+        else:
+            result = submit_spend(args, coin_ids, key, run=self.execute)
+            whole_wallet = False
+        return SpendResult(" ".join(args[:2]), tuple(coin_ids), self.check(result).strip(), whole_wallet)
+
+    def confirm(self, spend, timeout=CONFIRM_TIMEOUT, poll=CONFIRM_POLL_SECONDS):
+        # Waits until the spent coins are gone from the wallet, then releases their reservations.
+        # Returns False, keeping the reservations, when they are still there after timeout seconds.
+        spent = {coin_id.lower() for coin_id in spend.coin_ids}
+        deadline = time.time() + timeout
+        while spent & {coin.id.lower() for coin in self.coins()}:
+            if time.time() >= deadline:
+                return False
+            time.sleep(poll)
+        self.release(spend)
+        return True
+
+    def release(self, spend):
+        # Drops the reservations of a spend without waiting, e.g. once it is known to have failed
+        release_coins(spend.coin_ids, str(self.config_dir), whole_wallet=spend.whole_wallet)
+
+    def transfer(self, to_address, coin_id):
+        if not validate_hash(to_address) or not validate_hash(coin_id):
+            raise ValueError("Address and coin ID must be 0x + 64 hex chars")
+        return self.spend(["token", "transfer", to_address, coin_id], [coin_id])
+
+    def merge(self, coin_ids=None):
+        # Merges the given coins, or every coin of the wallet when coin_ids is None
+        if coin_ids is None:
+            return self.spend(["token", "merge", "all"], None)
+        if len(coin_ids) < 2:
+            raise ValueError("At least two coins are needed for a merge")
+        return self.spend(["token", "merge"] + list(coin_ids), coin_ids)
+
+    def split(self, coin_id, amounts):
+        # Amounts in QUIL as Decimal, str or number
+        units = [to_units(a) for a in amounts]
+        if len(units) < 2 or any(u <= 0 for u in units):
+            raise ValueError("A split needs at least two positive amounts")
+        return self.spend(["token", "split", coin_id] + [format_units(u) for u in units], [coin_id])
+
+# Daemon
+# Clients send one JSON request per connection: {"method": ..., "params": {...}} and get back
+# {"ok": true, "result": ...} or {"ok": false, "error": "..."}. The socket is only accessible
+# to the user running the daemon, since it can spend coins.
+class DaemonUnavailable(Exception):
+    pass
+
+def daemon_connect(method, params):
+    if DAEMON_MODE or not hasattr(socket, "AF_UNIX") or not DAEMON_SOCKET.exists():
+        raise DaemonUnavailable()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(DAEMON_TIMEOUT)
+        sock.connect(str(DAEMON_SOCKET))
+        sock.sendall((json.dumps({"method": method, "params": params}) + "\n").encode())
+    except OSError:
+        sock.close()
+        raise DaemonUnavailable()
+    return sock
+
+def daemon_response(reader):
+    # The request was sent, so a silent daemon is an error rather than a reason to run qclient locally
+    try:
+        line = reader.readline()
+    except socket.timeout:
+        raise RuntimeError(f"The daemon did not answer within {DAEMON_TIMEOUT} seconds")
+    except OSError:
+        raise DaemonUnavailable()
+    if not line:
+        raise DaemonUnavailable()
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error") or "Daemon request failed")
+    return response
+
+def daemon_request(method, **params):
+    with daemon_connect(method, params) as sock, sock.makefile("r", encoding="utf-8") as reader:
+        return daemon_response(reader)["result"]
+
+def daemon_stream(method, **params):
+    # Streamed responses are one JSON string per line, then {"returncode": ..., "stderr": ...}.
+    # Returns a generator over the lines, which returns that trailer; DaemonUnavailable is only
+    # raised here, before any line is read, so callers can still fall back to qclient.
+    sock = daemon_connect(method, params)
+    reader = sock.makefile("r", encoding="utf-8")
+    try:
+        daemon_response(reader)
+    except BaseException:
+        reader.close()
+        sock.close()
+        raise
+    return daemon_lines(sock, reader)
+
+def daemon_lines(sock, reader):
+    with sock, reader:
+        try:
+            for line in reader:
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    return item
+                yield item
+        except socket.timeout:
+            return {"returncode": -1, "stderr": f"The daemon sent nothing for {DAEMON_TIMEOUT} seconds"}
+        except OSError as e:
+            return {"returncode": -1, "stderr": f"Lost the connection to the daemon: {e}"}
+    return {"returncode": -1, "stderr": "The daemon closed the connection before the end of the listing"}
+
+def invalidate_daemon_cache(wallet=None):
+    # Spends that bypass the daemon (e.g. from a WalletClient) still drop its cached reads of the wallet
+    try:
+        daemon_request("invalidate", wallet=wallet or WALLET_NAME)
+    except (DaemonUnavailable, RuntimeError):
+        pass
+
+class DaemonState:
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.cache = {}
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def invalidate(self, wallet):
+        # wallet is a name, or the .config path of a WalletClient
+        target = wallet_key(wallet)
+        with self.lock:
+            for key in [k for k in self.cache if wallet_key(k[0]) == target]:
+                del self.cache[key]
+            for name in [w for w in list(COIN_INDEXES) if wallet_key(w) == target]:
+                COIN_INDEXES.pop(name, None)
+
+    def run(self, args, wallet):
+        key = (wallet, tuple(args))
+        if tuple(args[:2]) not in DAEMON_CACHED_COMMANDS:
+            # Anything else may change the wallet, so cached reads of it are dropped
+            result = run_qclient(args, wallet)
+            self.invalidate(wallet)
+            return {"returncode": result.returncode, "stdout": result.stdout, "stderr": result.stderr}
+        # Single flight: concurrent clients asking for the same read wait for one qclient call
+        with self.key_lock(key):
+            hit = self.cache.get(key)
+            if hit and time.time() - hit[0] < DAEMON_CACHE_TTL:
+                return hit[1]
+            result = run_qclient(args, wallet)
+            response = {"returncode": result.returncode, "stdout": result.stdout, "stderr": result.stderr}
+            if result.returncode == 0:
+                self.cache[key] = (time.time(), response)
+            return response
+
+    def index(self, wallet, refresh=False):
+        with self.key_lock((wallet, "index")):
+            index = COIN_INDEXES.get(wallet)
+            if refresh or index is None or time.time() - index.built_at > DAEMON_INDEX_TTL:
+                index = get_coin_index(wallet, refresh=True)
+        return index
+
+    def coins(self, wallet, query, refresh=False):
+        out = io.StringIO()
+        print_coin_query(self.index(wallet, refresh), argparse.Namespace(**query), out)
+        return out.getvalue()
+
+    def listing(self, args, wallet, refresh=False):
+        # 'token coins [metadata]' in qclient's format, from the warm index
+        index = self.index(wallet, refresh)
+        metadata = "metadata" in args
+        return (index.format_row(i, metadata) for i in range(len(index)))
+
+    def ping(self):
+        return {"version": SCRIPT_VERSION, "pid": os.getpid(), "uptime": time.time() - self.started,
+                "qclient": str(QCLIENT_EXEC), "cached": len(self.cache), "indexes": sorted(COIN_INDEXES),
+                "concurrency": QCLIENT_LIMITER.stats(), "verification": verify_release_binary(QCLIENT_EXEC)}
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        state = self.server.state
+        streams = {
+            "listing": lambda args, wallet, refresh=False: state.listing(args, wallet, refresh),
+        }
+        methods = {
+            "ping": lambda: state.ping(),
+            "run": lambda args, wallet: state.run(args, wallet),
+            "coins": lambda wallet, query, refresh=False: state.coins(wallet, query, refresh),
+            "invalidate": lambda wallet: state.invalidate(wallet),
+            "metrics": lambda: METRICS.summary(),
+            "shutdown": lambda: threading.Thread(target=self.server.shutdown).start(),
+        }
+        lines = None
+        try:
+            request = json.loads(self.rfile.readline())
+            if request["method"] in streams:
+                lines = streams[request["method"]](**request.get("params", {}))
+                response = {"ok": True, "stream": True}
+            else:
+                response = {"ok": True, "result": methods[request["method"]](**request.get("params", {}))}
+        except KeyError as e:
+            response = {"ok": False, "error": f"Unknown method or missing parameter: {e}"}
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        try:
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            if lines is not None:
+                self.write_stream(lines)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading, e.g. once it found the coin it was looking for
+
+    def write_stream(self, lines):
+        trailer = {"returncode": 0, "stderr": ""}
+        try:
+            while True:
+                batch = list(itertools.islice(lines, RENDER_BATCH_LINES))
+                if not batch:
+                    break
+                self.wfile.write("".join(json.dumps(line) + "\n" for line in batch).encode())
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            trailer = {"returncode": 1, "stderr": str(e)}
+        self.wfile.write((json.dumps(trailer) + "\n").encode())
+
+def run_daemon():
+    global DAEMON_MODE
+    if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+        error_message("Daemon mode requires Unix sockets, which are not available on this platform")
+        return 1
+    try:
+        daemon_request("ping")
+        error_message(f"A daemon is already running on {DAEMON_SOCKET}")
+        return 1
+    except DaemonUnavailable:
+        pass
+    except RuntimeError as e:
+        error_message(f"A daemon is running on {DAEMON_SOCKET} but not answering: {e}")
+        return 1
+    if DAEMON_SOCKET.exists():
+        DAEMON_SOCKET.unlink()  # left over from a daemon that did not shut down cleanly
+    DAEMON_MODE = True
+    old_umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(str(DAEMON_SOCKET), DaemonHandler)
+    finally:
+        os.umask(old_umask)
+    server.daemon_threads = True
+    server.state = DaemonState()
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"✅ Q1 Wallet daemon listening on {DAEMON_SOCKET} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if DAEMON_SOCKET.exists():
+            DAEMON_SOCKET.unlink()
+    print("Daemon stopped.")
+    return 0
+
 # Qclient Binary Management
 def get_platform_info():
     system = platform.system().lower()
@@ -182,26 +1637,100 @@ def get_platform_info():
     return mapped_os, mapped_arch, suffix
 
 
-def find_qclient_binary():
-    global QCLIENT_EXEC
+def release_version(path):
+    match = re.search(r'qclient-(\d+\.\d+\.\d+\.\d*)', Path(path).name)
+    return match.group(1) if match else None
+
+def version_key(version):
+    return [int(p) if p.isdigit() else 0 for p in version.split('.')]
+
+def installed_releases():
+    # [(version, binary)] of this platform, newest first
     os_name, arch, suffix = get_platform_info()
     if not os_name:
+        return []
+    binaries = [f for f in QCLIENT_DIR.glob(f"qclient-*-{os_name}-{arch}{suffix}")
+                if not f.name.endswith((".dgst", "Zone.Identifier")) and ".sig" not in f.name
+                and release_version(f) and f.exists()]
+    return sorted(((release_version(f), f) for f in binaries), key=lambda r: version_key(r[0]), reverse=True)
+
+def load_release_policy():
+    try:
+        policy = json.loads(RELEASE_POLICY_FILE.read_text())
+    except (OSError, ValueError):
+        policy = {}
+    return {"keep": max(1, int(policy.get("keep", RELEASE_KEEP))), "pinned": policy.get("pinned")}
+
+def save_release_policy(policy):
+    tmp = RELEASE_POLICY_FILE.with_name(f".{RELEASE_POLICY_FILE.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(policy))
+    os.replace(tmp, RELEASE_POLICY_FILE)
+
+def find_qclient_binary():
+    # The pinned version when it is installed, else the newest one
+    global QCLIENT_EXEC
+    releases = installed_releases()
+    if not releases:
         return None
-    pattern = f"qclient-*-{os_name}-{arch}{suffix}"
-    binaries = sorted(
-        [f for f in QCLIENT_DIR.glob(pattern) if not f.name.endswith((".dgst", ".sig", "Zone.Identifier"))],
-        key=lambda x: re.search(r'qclient-(\d+\.\d+\.\d+\.\d*)', x.name).group(1) if re.search(r'qclient-(\d+\.\d+\.\d+\.\d*)', x.name) else "0.0.0.0"
-    )
-    # Comment out debug messages
-    # print(f"DEBUG: Searching for binaries with pattern '{pattern}' in {QCLIENT_DIR}")
-    # print(f"DEBUG: Found binaries: {[f.name for f in binaries]}")
-    if binaries:
-        QCLIENT_EXEC = binaries[-1]
-        QCLIENT_EXEC.chmod(QCLIENT_EXEC.stat().st_mode | 0o111)
-        # print(f"DEBUG: Selected binary: {QCLIENT_EXEC.name}")
-        return QCLIENT_EXEC
-    # print("DEBUG: No matching binaries found")
-    return None
+    pinned = load_release_policy()["pinned"]
+    QCLIENT_EXEC = next((f for v, f in releases if v == pinned), releases[0][1])
+    QCLIENT_EXEC.chmod(QCLIENT_EXEC.stat().st_mode | 0o111)
+    return QCLIENT_EXEC
+
+def file_fingerprint(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def release_file_digest(path):
+    digest = hashlib.sha3_256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(VERIFY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def verify_release_binary(binary):
+    # Checks a qclient binary against the SHA3-256 digest published in its .dgst file and counts
+    # the .dgst signatures next to it. The binary is only hashed again when it or its .dgst changed.
+    binary = Path(binary)
+    dgst = binary.with_name(f"{binary.name}.dgst")
+    signatures = len(list(binary.parent.glob(f"{binary.name}.dgst.sig.*")))
+    if not dgst.exists():
+        return {"status": "unverified", "signatures": signatures}
+    key = file_fingerprint(binary) + file_fingerprint(dgst)
+    try:
+        cache = json.loads(VERIFY_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        cache = {}
+    entry = cache.get(str(binary))
+    if entry and entry["key"] == key:
+        return dict(entry, signatures=signatures)
+    published = re.search(r"[0-9a-fA-F]{64}", dgst.read_text(errors="replace"))
+    if not published:
+        return {"status": "unverified", "signatures": signatures}
+    # A binary hardlinked from the release cache was hashed when it was stored
+    digest = cached_release_digest(binary.name)
+    if not (digest and os.path.samefile(release_cache_object(digest), binary)):
+        digest = release_file_digest(binary)
+    entry = {"key": key, "status": "verified" if digest == published.group().lower() else "mismatch"}
+    cache = {path: e for path, e in cache.items() if Path(path).exists()}
+    cache[str(binary)] = entry
+    try:
+        tmp = VERIFY_CACHE_FILE.with_name(f".{VERIFY_CACHE_FILE.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(cache))
+        os.replace(tmp, VERIFY_CACHE_FILE)
+    except OSError:
+        pass
+    return dict(entry, signatures=signatures)
+
+def check_binary_integrity(out=None):
+    # The command line passes sys.stderr, so warnings never mix into exported data
+    result = verify_release_binary(QCLIENT_EXEC)
+    if result["status"] == "mismatch":
+        error_message(f"{QCLIENT_EXEC.name} does not match its published digest. "
+                      "Delete it and download it again with U) Check for updates.", file=out)
+    elif result["status"] == "unverified":
+        warning_message(f"{QCLIENT_EXEC.name} has no .dgst file and could not be verified", file=out)
+    return result["status"] != "mismatch"
 
 def version_gt(v1, v2):
     v1_parts = [int(x) for x in v1.split('.')]
@@ -214,7 +1743,7 @@ def check_qclient_version():
     if not os_name:
         return False
     try:
-        files = requests.get(QCLIENT_RELEASE_URL, timeout=10).text.splitlines()
+        files = http_get(QCLIENT_RELEASE_URL, "release_list", timeout=10).text.splitlines()
         version_pattern = r'qclient-(\d+\.\d+\.\d+\.\d*)-{}-{}'.format(os_name, arch)
         remote_versions = [re.search(version_pattern, f).group(1) for f in files if re.search(version_pattern, f)]
         if not remote_versions:
@@ -227,14 +1756,18 @@ def check_qclient_version():
             print("No local Qclient found.")
             return download_latest_qclient()
         
-        local_version = re.search(r'qclient-(\d+\.\d+\.\d+\.\d*)', local_binary.name).group(1) or "0.0.0.0"
+        local_version = release_version(local_binary) or "0.0.0.0"
         print(f"Current local version: {local_version}")
         print(f"Latest remote version: {remote_version}")
+        pinned = load_release_policy()["pinned"]
+        if pinned and version_gt(remote_version, local_version):
+            print(f"\nQclient is pinned to v{pinned}. Unpin it in R) Qclient versions to update.")
+            return True
         
         if version_gt(remote_version, local_version):
             warning_message("A new version of Qclient is available!")
             if download_latest_qclient():
-                cleanup_old_releases(remote_version)
+                prune_releases()
                 print("✅ Update completed successfully!")
                 time.sleep(3)
                 return True
@@ -259,7 +1792,7 @@ def download_latest_qclient():
         return False
     print("\n⏳ Downloading Qclient...")
     try:
-        files = requests.get(QCLIENT_RELEASE_URL, timeout=10).text.splitlines()
+        files = http_get(QCLIENT_RELEASE_URL, "release_list", timeout=10).text.splitlines()
         version_pattern = r'qclient-(\d+\.\d+\.\d+\.\d*)-{}-{}'.format(os_name, arch)
         versions = [re.search(version_pattern, f).group(1) for f in files if re.search(version_pattern, f)]
         if not versions:
@@ -269,12 +1802,8 @@ def download_latest_qclient():
         matched_files = [f for f in files if f"qclient-{latest_version}-{os_name}-{arch}" in f]
         for file in matched_files:
             if not (QCLIENT_DIR / file).exists():
-                print(f"Downloading {file}...")
-                response = requests.get(f"{QUILIBRIUM_RELEASES}/{file}", timeout=300)
-                with open(QCLIENT_DIR / file, 'wb') as f:
-                    f.write(response.content)
-                if not file.endswith((".dgst", ".sig")):
-                    (QCLIENT_DIR / file).chmod(0o755)
+                print(f"Installing {file} from the release cache..." if cached_release_digest(file) else f"Downloading {file}...")
+                fetch_release_file(file, QCLIENT_DIR / file)
         QCLIENT_EXEC = find_qclient_binary()
         if QCLIENT_EXEC:
             print(f"✅ Successfully downloaded Qclient v{latest_version} to {QCLIENT_DIR}")
@@ -286,17 +1815,213 @@ def download_latest_qclient():
         error_message(f"Download failed: {e}")
         return False
 
-def cleanup_old_releases(new_version):
-    print("\nCleaning up old release files...")
+# Release Cache
+# objects/<digest[:2]>/<digest> holds the file contents, names/<release file name> the digest of that
+# file. Release file names are never reused, so a cached name can be installed without any download.
+# Binaries are only stored and installed when they match the SHA3-256 digest of their .dgst file.
+# RELEASE CACHE START: menu.py holds the source of this section, install.py an identical copy (install.py --check-release-cache)
+def release_cache_object(digest):
+    return RELEASE_CACHE_DIR / "objects" / digest[:2] / digest
+
+def release_tmp_name(path):
+    # Unique per process and thread, installs and mirror runs write from several threads
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def is_signature_file(name):
+    return name.endswith((".dgst", ".sig")) or ".sig." in name
+
+def cached_object_digest(digest):
+    h = hashlib.sha3_256()
+    with open(release_cache_object(digest), "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cached_release_digest(name, expected=None):
+    # Digest of the cached file, or None when it is not cached or does not match expected. Objects of a
+    # shared cache (Q1WALLET_RELEASE_CACHE) are hashed again, other hosts and users write to it too.
+    try:
+        digest = (RELEASE_CACHE_DIR / "names" / name).read_text().strip()
+        if not release_cache_object(digest).exists() or (expected and digest != expected):
+            return None
+        if RELEASE_CACHE_SHARED and cached_object_digest(digest) != digest:
+            return None
+    except OSError:
+        return None
+    return digest
+
+def store_release_file(name, content):
+    digest = hashlib.sha3_256(content).hexdigest()
+    obj = release_cache_object(digest)
+    if not obj.exists() or (RELEASE_CACHE_SHARED and cached_object_digest(digest) != digest):
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = release_tmp_name(obj)
+        tmp.write_bytes(content)
+        tmp.chmod(0o644 if is_signature_file(name) else 0o755)
+        os.replace(tmp, obj)
+    entry = RELEASE_CACHE_DIR / "names" / name
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = release_tmp_name(entry)
+    tmp.write_text(digest)
+    os.replace(tmp, entry)
+    return digest
+
+def link_release_file(digest, dest):
+    # Hardlink when the cache is on the same filesystem, else reflink, else copy
+    obj = release_cache_object(digest)
+    tmp = release_tmp_name(dest)
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(obj, tmp)
+    except OSError:
+        with open(obj, "rb") as src, open(tmp, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except (AttributeError, OSError):
+                shutil.copyfileobj(src, dst)
+        shutil.copymode(obj, tmp)
+    os.replace(tmp, dest)
+
+def parse_release_digest(text):
+    match = re.search(r"[0-9a-fA-F]{64}", text)
+    return match.group().lower() if match else None
+
+def download_release_content(name, expected=None):
+    # Raises for HTTP errors and for content that fails its check, so error pages are never cached
+    response = release_http_get(f"{QUILIBRIUM_RELEASES}/{name}")
+    response.raise_for_status()
+    if name.endswith(".dgst") and not parse_release_digest(response.content.decode(errors="replace")):
+        raise ValueError(f"{name} does not contain a SHA3-256 digest")
+    if expected and hashlib.sha3_256(response.content).hexdigest() != expected:
+        raise ValueError(f"{name} does not match its published digest")
+    return response.content
+
+def published_release_digest(name):
+    # The digest published in <name>.dgst, None for .dgst and signature files themselves
+    if is_signature_file(name):
+        return None
+    digest = cached_release_digest(f"{name}.dgst")
+    if digest:
+        return parse_release_digest(release_cache_object(digest).read_text(errors="replace"))
+    content = download_release_content(f"{name}.dgst")
+    try:
+        store_release_file(f"{name}.dgst", content)
+    except OSError:
+        pass
+    return parse_release_digest(content.decode(errors="replace"))
+
+def download_release_file(name):
+    # Returns the digest of the verified cached file, downloading it only if it is not cached yet
+    expected = published_release_digest(name)
+    return cached_release_digest(name, expected) or store_release_file(name, download_release_content(name, expected))
+
+def fetch_release_file(name, dest):
+    # Installs a verified release file from the cache, downloading it into the cache first if needed.
+    # Returns True when no download was necessary.
+    expected = published_release_digest(name)
+    digest = cached_release_digest(name, expected)
+    if digest:
+        link_release_file(digest, dest)
+        return True
+    content = download_release_content(name, expected)
+    try:
+        link_release_file(store_release_file(name, content), dest)
+    except OSError:
+        # Cache not writable, install the download directly
+        dest.write_bytes(content)
+        if not is_signature_file(name):
+            dest.chmod(0o755)
+    return False
+# RELEASE CACHE END
+
+def release_http_get(url):
+    return http_get(url, "release_download", timeout=300)
+
+def prune_releases(keep=None):
+    # Removes the files of versions outside the retention policy. The pinned and the active
+    # version are always kept. Files stay in the release cache, so re-installing one is instant.
+    policy = load_release_policy()
+    keep = keep or policy["keep"]
+    releases = installed_releases()
+    retained = {v for v, _ in releases[:keep]} | {policy["pinned"], release_version(QCLIENT_EXEC) if QCLIENT_EXEC else None}
     os_name, arch, suffix = get_platform_info()
-    if not os_name:
-        return
-    for file in QCLIENT_DIR.glob(f"qclient-*{os_name}-{arch}*"):
-        version_match = re.search(r'qclient-(\d+\.\d+\.\d+\.\d*)', file.name)
-        if version_match and version_match.group(1) != new_version:
-            print(f"Removing {file.name}")
+    removed = []
+    for file in QCLIENT_DIR.glob(f"qclient-*-{os_name}-{arch}*"):
+        version = release_version(file)
+        if version and version not in retained:
             file.unlink()
-    print("✅ Cleanup complete")
+            if version not in removed:
+                removed.append(version)
+    if removed:
+        print(f"Removed old Qclient versions: {', '.join(sorted(removed, key=version_key))} (keeping {keep})")
+    return removed
+
+def pin_release(version):
+    global QCLIENT_EXEC
+    if version is not None and version not in dict(installed_releases()):
+        raise ValueError(f"Qclient v{version} is not installed")
+    policy = load_release_policy()
+    policy["pinned"] = version
+    save_release_policy(policy)
+    QCLIENT_EXEC = find_qclient_binary()
+    return QCLIENT_EXEC
+
+def rollback_release():
+    # Pins the newest retained version older than the active one
+    active = release_version(QCLIENT_EXEC) if QCLIENT_EXEC else None
+    older = [v for v, _ in installed_releases() if active and version_key(v) < version_key(active)]
+    if not older:
+        raise ValueError("No older Qclient version is installed")
+    pin_release(older[0])
+    return older[0]
+
+def print_releases():
+    policy = load_release_policy()
+    active = release_version(QCLIENT_EXEC) if QCLIENT_EXEC else None
+    releases = installed_releases()
+    for i, (version, binary) in enumerate(releases, 1):
+        marks = [m for m, on in (("active", version == active), ("pinned", version == policy["pinned"]),
+                                 ("newest", i == 1)) if on]
+        verified = verify_release_binary(binary)
+        marks.append({"verified": "digest verified", "mismatch": "DIGEST MISMATCH"}.get(verified["status"], "not verified")
+                     + f", {verified['signatures']} signatures")
+        print(f"{i}) v{version}" + (f"  ({', '.join(marks)})" if marks else ""))
+    print(f"\nKeeping the newest {policy['keep']} versions" + (f", pinned to v{policy['pinned']}" if policy["pinned"] else ", following the newest version"))
+    return releases
+
+def release_manager():
+    print(format_title("Qclient versions"))
+    print("Switch between the installed Qclient versions. Pinning a version keeps it active until unpinned.")
+    while True:
+        print()
+        releases = print_releases()
+        choice = input("\nNumber to pin that version, 'r' to roll back, 'u' to unpin, 'k' to set how many versions to keep, "
+                       "or 'e' to exit: ").strip().lower()
+        try:
+            if choice == 'e':
+                main()
+                return
+            elif choice == 'r':
+                print(f"✅ Rolled back to v{rollback_release()}")
+            elif choice == 'u':
+                pin_release(None)
+                print(f"✅ Unpinned, using v{release_version(QCLIENT_EXEC)}")
+            elif choice == 'k':
+                keep = input(f"Versions to keep (currently {load_release_policy()['keep']}): ").strip()
+                if not keep.isdigit() or int(keep) < 1:
+                    raise ValueError("Please enter a number of at least 1")
+                policy = load_release_policy()
+                policy["keep"] = int(keep)
+                save_release_policy(policy)
+                prune_releases()
+            elif choice.isdigit() and 1 <= int(choice) <= len(releases):
+                pin_release(releases[int(choice) - 1][0])
+                print(f"✅ Pinned v{release_version(QCLIENT_EXEC)}")
+            else:
+                error_message("Invalid choice")
+        except ValueError as e:
+            error_message(str(e))
 
 def check_qclient_binary():
     global QCLIENT_EXEC
@@ -305,6 +2030,7 @@ def check_qclient_binary():
         error_message(f"No Qclient found in: {QCLIENT_DIR}")
         print("Qclient is required to manage your wallet.")
         return download_latest_qclient()
+    check_binary_integrity()
     return check_qclient_version()
 
 # Wallet Encryption
@@ -346,17 +2072,21 @@ def display_menu():
 1) Check balance / address   6) Check individual coins      
 2) Create transaction        7) Merge coins   
                              8) Split coins  
+                             9) Query coins
+--------------------------------------------------------
+B) Batch operations on multiple wallets
 --------------------------------------------------------
 10) Create new wallet       12) Switch wallet
 11) Import wallet           13) Encrypt/decrypt wallet
                             14) Delete wallet
 --------------------------------------------------------
 U) Check for updates         X) Disclaimer   
-S) Security settings         H) Help
+R) Qclient versions/rollback H) Help
+S) Security settings
 -------------------------------------------------------- 
 D) Donations 
 --------------------------------------------------------    
-E) Exit                      v {SCRIPT_VERSION}
+E) Exit                      v {SCRIPT_VERSION}{" [profiling]" if PROFILING else ""}
 """)
     print(f"{ORANGE}The Q1 WALLET is still in beta. Use at your own risk.{NC}\n")
 
@@ -374,19 +2104,312 @@ def check_balance():
     if not check_wallet_encryption():
         return
     print(format_title("Token balance and account address"))
-    result = subprocess.run([str(QCLIENT_EXEC), "token", "balance"] + FLAGS, text=True, capture_output=True)
+    result = run_qclient(["token", "balance"])
     print(result.stdout or result.stderr)
+    units, account = parse_balance(result.stdout)
+    if result.returncode == 0 and units is not None:
+        record_wallet_balance(WALLET_NAME, units, account)
+        history = format_history(WALLET_NAME)
+        if history:
+            print(f"Last 30 days: {history}")
     press_any_key()
 
+def render_coins(metadata=True, index=None):
+    # Print coins as qclient produces them, while counting and summing them on the fly.
+    # Returns the coin count and the newest frame seen, for confirmation polling.
+    # The coins are also added to index, when given.
+    stream = QclientStream(["token", "coins", "metadata"] if metadata else ["token", "coins"])
+    count, total_units, max_frame = 0, 0, 0
+    for coin in parse_coins(render_lines(stream)):
+        count += 1
+        total_units += coin[1]
+        max_frame = max(max_frame, coin[2] or 0)
+        if index is not None:
+            index.add(coin[0], coin[1], coin[2] or 0, parse_timestamp(coin[3]) if coin[3] else 0)
+    if stream.returncode != 0:
+        error_message(stream.stderr.strip() or f"qclient exited with code {stream.returncode}")
+    elif count:
+        print(f"\n{BOLD}{count} coins, total {format_units(total_units)} QUIL{NC}")
+    else:
+        print(stream.stderr.strip() or "No coins found.")
+    return count, max_frame
+
+def coin_tally(wallet=None):
+    stream = QclientStream(["token", "coins", "metadata"], wallet)
+    count, max_frame = 0, 0
+    for coin in parse_coins(stream):
+        count += 1
+        max_frame = max(max_frame, coin[2] or 0)
+    if stream.returncode != 0:
+        raise RuntimeError(stream.stderr.strip() or f"qclient exited with code {stream.returncode}")
+    return count, max_frame
+
+def scan_coins_since(since_frame, watch_ids=(), wallet=None):
+    # Single streaming pass that keeps only the recent tail (coins newer than since_frame)
+    # and which of watch_ids are still present, instead of indexing the whole wallet
+    stream = QclientStream(["token", "coins", "metadata"], wallet, refresh=True)
+    watch_ids = {c.lower() for c in watch_ids}
+    new_coins, present = [], set()
+    for coin in parse_coins(stream):
+        if coin[2] is not None and coin[2] > since_frame:
+            new_coins.append(coin)
+        if coin[0].lower() in watch_ids:
+            present.add(coin[0].lower())
+    if stream.returncode != 0:
+        return None, None
+    return new_coins, present
+
+def wait_for_confirmation(since_frame, spent_ids=(), expect_new=True, wallet=None):
+    # Confirmed once all spent_ids are gone (and, with expect_new, a newer coin exists).
+    # Each poll only keeps the tail beyond the cached index, which is then updated in place
+    # instead of being rebuilt from a full listing.
+    wallet = wallet or WALLET_NAME
+    index = COIN_INDEXES.get(wallet)
+    known_frame = since_frame if index is None else max(since_frame, index.max_frame())
+    deadline = time.time() + CONFIRM_TIMEOUT
+    while True:
+        wait_with_spinner("Waiting for confirmation, next check in {} secs...", CONFIRM_POLL_SECONDS)
+        tail, present = scan_coins_since(known_frame, spent_ids, wallet)
+        if tail is not None and not present:
+            new_coins = tail
+            if index is not None:
+                index.discard(spent_ids)
+                for coin_id, units, frame, timestamp in tail:
+                    if index.find(coin_id) is None:
+                        index.add(coin_id, units, frame or 0, parse_timestamp(timestamp) if timestamp else 0)
+                new_coins = [(coin_id, units, frame, format_timestamp(timestamp))
+                             for coin_id, units, frame, timestamp in map(index.row, index.newer_than(since_frame))]
+            if new_coins or not expect_new:
+                if index is not None:
+                    save_coin_snapshot(wallet, index)
+                return True, new_coins
+        if time.time() >= deadline:
+            return False, tail or []
+
+def report_confirmation(since_frame, spent_ids=(), expect_new=True, whole_wallet=False):
+    confirmed, new_coins = wait_for_confirmation(since_frame, spent_ids, expect_new)
+    if confirmed:
+        # The spent coins are gone, so their reservations (and the whole-wallet one for 'merge all') can go too
+        release_coins(spent_ids, whole_wallet=whole_wallet)
+        print("\n✅ Confirmed.")
+    else:
+        warning_message(f"Not confirmed after {CONFIRM_TIMEOUT} seconds. Check again later from the main menu.")
+    if new_coins:
+        print(f"\nNew coins since frame {since_frame}:\n" + "-" * 30)
+        for coin_id, units, frame, timestamp in new_coins:
+            print(f"{format_units(units)} QUIL (Coin {coin_id}) Frame {frame}, Timestamp {timestamp}")
+
 def check_coins():
     if not check_wallet_encryption():
         return
     print(format_title("Individual coins"))
-    result = subprocess.run([str(QCLIENT_EXEC), "token", "coins", "metadata"] + FLAGS, text=True, capture_output=True)
-    output = result.stdout or result.stderr
-    print(output)
+    snapshot = load_coin_snapshot(WALLET_NAME)
+    if not snapshot:
+        index = CoinIndex()
+        if render_coins(index=index)[0]:
+            save_coin_snapshot(WALLET_NAME, index)
+        press_any_key()
+        return
+    # Stale while revalidate: show the last snapshot, then the changes once the live listing arrives.
+    # The listing runs in a daemon thread, so a hung qclient can be left behind with Ctrl+C or the timeout.
+    live = concurrent.futures.Future()
+    def refresh():
+        try:
+            live.set_result(get_coin_index(WALLET_NAME, True))
+        except BaseException as e:
+            live.set_exception(e)
+    threading.Thread(target=refresh, daemon=True).start()
+    try:
+        for _ in render_lines(snapshot.format_row(i) for i in range(len(snapshot))):
+            pass
+        print(f"\n{BOLD}{len(snapshot)} coins, total {format_units(snapshot.total())} QUIL{NC}")
+        print(f"{ORANGE}Snapshot from {format_age(time.time() - snapshot.built_at)}, refreshing...{NC}")
+        # Short waits keep Ctrl+C responsive, also on Windows
+        deadline = time.time() + COIN_REFRESH_TIMEOUT
+        while True:
+            try:
+                print_snapshot_changes(snapshot, live.result(timeout=0.5))
+                break
+            except concurrent.futures.TimeoutError:
+                if time.time() >= deadline:
+                    warning_message(f"No live listing after {COIN_REFRESH_TIMEOUT} seconds, the snapshot above may be outdated.")
+                    break
+    except RuntimeError as e:
+        error_message(f"Could not refresh the coins: {e}")
+    except KeyboardInterrupt:
+        print("\nRefresh cancelled, the snapshot above may be outdated.")
+    finally:
+        snapshot.close()
     press_any_key()
 
+def load_coin_index(wallet=None, refresh=False):
+    stream = QclientStream(["token", "coins", "metadata"], wallet, refresh)
+    index = CoinIndex.from_coins(parse_coins(stream))
+    if stream.returncode != 0:
+        raise RuntimeError(stream.stderr.strip() or f"qclient exited with code {stream.returncode}")
+    return index
+
+def get_coin_index(wallet=None, refresh=False):
+    # Per-wallet index, kept until refreshed; confirmed operations update it in place
+    wallet = wallet or WALLET_NAME
+    if refresh or wallet not in COIN_INDEXES:
+        cache_coin_index(load_coin_index(wallet, refresh), wallet)
+    return COIN_INDEXES[wallet]
+
+def cache_coin_index(index, wallet=None):
+    wallet = wallet or WALLET_NAME
+    COIN_INDEXES[wallet] = index
+    save_coin_snapshot(wallet, index)
+
+def coin_snapshot_path(wallet):
+    return COIN_SNAPSHOT_DIR / f"{wallet}.coins"
+
+def save_coin_snapshot(wallet, index):
+    path = coin_snapshot_path(wallet)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(COIN_SNAPSHOT_HEADER.pack(COIN_SNAPSHOT_MAGIC, len(index), index.built_at))
+            for column in (index.ids, index.amounts, index.frames, index.timestamps):
+                f.write(column)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+def load_coin_snapshot(wallet):
+    # Read-only CoinIndex whose columns are views of the memory-mapped snapshot, or None
+    try:
+        with open(coin_snapshot_path(wallet), "rb") as f:
+            # Windows cannot replace a mapped file, so the snapshot is read there instead
+            data = f.read() if os.name == "nt" else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    magic, count, built_at = COIN_SNAPSHOT_HEADER.unpack_from(data) if len(data) >= COIN_SNAPSHOT_HEADER.size else (None, 0, 0)
+    if magic != COIN_SNAPSHOT_MAGIC or len(data) != COIN_SNAPSHOT_HEADER.size + count * (CoinIndex.ID_SIZE + 24):
+        if isinstance(data, mmap.mmap):
+            data.close()
+        return None
+    view = memoryview(data)
+    index = CoinIndex()
+    offset = COIN_SNAPSHOT_HEADER.size
+    index.ids = view[offset:offset + count * CoinIndex.ID_SIZE]
+    offset += count * CoinIndex.ID_SIZE
+    index.amounts, index.frames, index.timestamps = (view[offset + i * count * 8:offset + (i + 1) * count * 8].cast("q")
+                                                     for i in range(3))
+    index.built_at = built_at
+    index.mapping = (view, data)
+    return index
+
+def print_snapshot_changes(snapshot, live):
+    if bytes(snapshot.ids) == bytes(live.ids) and list(snapshot.amounts) == list(live.amounts):
+        print(f"✅ Up to date ({len(live)} coins)")
+        return
+    before = {snapshot.coin_id(i): i for i in range(len(snapshot))}
+    added = [i for i in range(len(live)) if before.pop(live.coin_id(i), None) is None]
+    print(f"\n{BOLD}Live: {len(added)} new, {len(before)} spent{NC}")
+    for i in added:
+        print("+ " + live.format_row(i))
+    for i in before.values():
+        print("- " + snapshot.format_row(i))
+    print(f"\n{BOLD}{len(live)} coins, total {format_units(live.total())} QUIL{NC}")
+
+def positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive number: {text}")
+    return value
+
+def coin_id_prefix(text):
+    digits = text[2:] if text.lower().startswith("0x") else text
+    if len(digits) > CoinIndex.ID_SIZE * 2 or not all(c in string.hexdigits for c in digits):
+        raise argparse.ArgumentTypeError(f"not a hex coin ID prefix: {text}")
+    return text
+
+def coin_query_parser(prog="coins"):
+    parser = argparse.ArgumentParser(prog=prog, description="Filter, sort and summarize the coins of a wallet")
+    parser.add_argument("--sort", choices=("amount", "frame", "id"), default="amount", help="sort key (default: amount)")
+    parser.add_argument("--desc", action="store_true", help="sort in descending order")
+    parser.add_argument("--min", type=float, dest="min_amount", help="minimum coin amount in QUIL")
+    parser.add_argument("--max", type=float, dest="max_amount", help="maximum coin amount in QUIL")
+    parser.add_argument("--prefix", dest="id_prefix", type=coin_id_prefix, help="coin ID prefix, e.g. 0xab12")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--top", type=positive_int, help="show only the first N coins of the sort order")
+    group.add_argument("--bottom", type=positive_int, help="show only the last N coins of the sort order")
+    parser.add_argument("--summary", action="store_true", help="print count and sum only")
+    parser.add_argument("--histogram", action="store_true", help="print an amount histogram")
+    return parser
+
+def print_coin_query(index, options, out=None):
+    out = out or sys.stdout
+    rows = index.query(sort=options.sort, descending=options.desc, min_amount=options.min_amount,
+                       max_amount=options.max_amount, id_prefix=options.id_prefix,
+                       top=options.top, bottom=options.bottom)
+    if not options.summary:
+        for i in rows:
+            out.write(index.format_row(i) + "\n")
+    out.write(f"\n{len(rows)} of {len(index)} coins, total {format_units(index.total(rows))} QUIL\n")
+    if options.histogram:
+        histogram = index.histogram(rows)
+        peak = max(count for _, count in histogram) or 1
+        out.write("\nAmount (QUIL)      Coins\n")
+        for label, count in histogram:
+            out.write(f"{label:<16}{count:>9}  {'#' * round(40 * count / peak)}\n")
+
+def run_coin_query(options, wallet=None, refresh=False):
+    # Runs the query in the daemon when one is running, so its warm index is shared
+    wallet = wallet or WALLET_NAME
+    query = {key: getattr(options, key) for key in
+             ("sort", "desc", "min_amount", "max_amount", "id_prefix", "top", "bottom", "summary", "histogram")}
+    try:
+        return daemon_request("coins", wallet=wallet, query=query, refresh=refresh)
+    except DaemonUnavailable:
+        pass
+    out = io.StringIO()
+    print_coin_query(get_coin_index(wallet, refresh), argparse.Namespace(**query), out)
+    return out.getvalue()
+
+def coin_query():
+    if not check_wallet_encryption():
+        return
+    print(format_title("Query coins"))
+    print("Loading coins...")
+    parser = coin_query_parser(prog="query")
+    try:
+        print(run_coin_query(parser.parse_args(["--summary"])).strip())
+    except RuntimeError as e:
+        show_error_and_confirm(f"Could not load coins: {e}")
+        return
+    print("""
+Enter a query, for example:
+  --sort amount --desc --top 20      20 largest coins
+  --min 0.5 --max 10                 coins between 0.5 and 10 QUIL
+  --prefix 0xab --sort frame         coins whose ID starts with 0xab, oldest first
+  --summary --histogram              count, sum and amount histogram
+'r' reloads the coins from the network, 'e' returns to the main menu""")
+    while True:
+        query = input("\nQuery: ").strip()
+        if query.lower() == 'e':
+            main()
+            return
+        if query.lower() == 'r':
+            try:
+                print(run_coin_query(parser.parse_args(["--summary"]), refresh=True).strip())
+            except RuntimeError as e:
+                error_message(f"Could not load coins: {e}")
+            continue
+        try:
+            options = parser.parse_args(shlex.split(query))
+        except SystemExit:
+            continue
+        except ValueError as e:
+            error_message(f"Invalid query: {e}")
+            continue
+        try:
+            print(run_coin_query(options), end="")
+        except (RuntimeError, ValueError) as e:
+            error_message(f"Invalid query: {e}")
+
 def create_transaction():
     if not check_wallet_encryption():
         show_error_and_confirm("Wallet encryption check failed")
@@ -410,7 +2433,10 @@ def create_transaction():
     
     print("\nYour current coins before transaction:")
     print("--------------------------------------")
-    check_coins()
+    index = CoinIndex()
+    coin_count, since_frame = render_coins(index=index)
+    if coin_count:
+        cache_coin_index(index)
     
     while True:
         coin_id = input("\nEnter coin ID to transfer (or 'e' to exit): ")
@@ -422,19 +2448,21 @@ def create_transaction():
             break
         error_message("Invalid coin ID format (must be 0x + 64 hex chars)")
     
-    cmd = [str(QCLIENT_EXEC), "token", "transfer", to_address, coin_id] + FLAGS
+    args = ["token", "transfer", to_address, coin_id]
     print(f"\nTransaction Details:\n--------------------\nRecipient: {to_address}\nCoin ID: {coin_id}")
-    print(f"Command: {' '.join(cmd)}")
+    print(f"Command: {' '.join(qclient_command(args))}")
     if input("\nProceed with transaction? (y/n): ").lower() == 'y':
-        result = subprocess.run(cmd, text=True, capture_output=True)
+        try:
+            result = submit_spend(args, [coin_id])
+        except RuntimeError as e:
+            show_error_and_confirm(str(e))
+            return
         if result.returncode != 0:
             show_error_and_confirm("Transaction failed")
             return
         print("\nTransaction sent. The receiver does not need to accept it.")
-        wait_with_spinner("Checking updated coins in {} seconds...", 30)
-        print("\nYour coins after transaction:\n-----------------------------")
-        check_coins()
-        print("If you don't see the changes yet, wait and check again from the main menu.")
+        report_confirmation(since_frame, [coin_id], expect_new=False)
+        press_any_key()
         main()
     else:
         print("Transaction cancelled.")
@@ -459,7 +2487,10 @@ def token_split_advanced():
         error_message("Invalid choice. Please enter 1, 2, 3, or 'e' to exit.")
     
     print("\nYour current coins:\n-----------------")
-    check_coins()
+    index = CoinIndex()
+    coin_count, since_frame = render_coins(index=index)
+    if coin_count:
+        cache_coin_index(index)
     
     while True:
         coin_id = input("\nEnter coin ID to split (or 'e' to exit): ")
@@ -471,17 +2502,15 @@ def token_split_advanced():
             break
         error_message("Invalid coin ID format (must be 0x + 64 hex chars)")
     
-    coin_info = subprocess.run([str(QCLIENT_EXEC), "token", "coins"] + FLAGS, text=True, capture_output=True).stdout
-    match = re.search(rf"{coin_id}.*?(\d+\.\d+)\s+QUIL", coin_info)
-    if not match:
+    total_amount = find_coin_amount(QclientStream(["token", "coins"]), coin_id)
+    if total_amount is None:
         show_error_and_confirm("Could not determine coin amount.")
         return
-    total_amount = float(match.group(1))
-    print(f"\nSelected coin amount: {total_amount} QUIL")
+    print(f"\nSelected coin amount: {format_units(total_amount)} QUIL")
     
     if split_method == '1':
         while True:
-            amounts_input = input(f"\nEnter amounts separated by comma (up to 100, must sum to {total_amount})\nExample: 1.5,2.3,0.7\n> (or 'e' to exit): ")
+            amounts_input = input(f"\nEnter amounts separated by comma (up to 100, must sum to {format_units(total_amount)})\nExample: 1.5,2.3,0.7\n> (or 'e' to exit): ")
             if amounts_input.lower() == 'e':
                 print("Operation cancelled.")
                 main()
@@ -491,10 +2520,10 @@ def token_split_advanced():
                 error_message("Too many values (maximum 100)")
                 continue
             try:
-                amounts = [float(a) for a in amounts]
-                if abs(sum(amounts) - total_amount) < 0.000000000001:
+                amounts = [to_units(a.strip()) for a in amounts]
+                if sum(amounts) == total_amount:
                     break
-                error_message(f"Sum of amounts ({sum(amounts)}) does not match coin amount ({total_amount})")
+                error_message(f"Sum of amounts ({format_units(sum(amounts))}) does not match coin amount ({format_units(total_amount)})")
             except ValueError:
                 error_message("Invalid amount format")
     
@@ -509,7 +2538,7 @@ def token_split_advanced():
                 error_message("Please enter a number between 2 and 100")
                 continue
             num_parts = int(num_parts)
-            base_amount = total_amount / num_parts
+            base_amount = total_amount // num_parts
             amounts = [base_amount] * (num_parts - 1) + [total_amount - base_amount * (num_parts - 1)]
             break
     
@@ -525,30 +2554,32 @@ def token_split_advanced():
                 error_message("Too many values (maximum 100)")
                 continue
             try:
-                percentages = [float(p) for p in percentages]
-                if abs(sum(percentages) - 100) < 0.000000000001:
-                    amounts = [total_amount * p / 100 for p in percentages[:-1]]
+                percentages = [Decimal(p.strip()) for p in percentages]
+                if sum(percentages) == 100:
+                    amounts = [int(total_amount * p / 100) for p in percentages[:-1]]
                     amounts.append(total_amount - sum(amounts))
                     break
                 error_message(f"Percentages must sum to 100 (current sum: {sum(percentages)})")
-            except ValueError:
+            except (ValueError, InvalidOperation):
                 error_message("Invalid percentage format")
     
-    cmd = [str(QCLIENT_EXEC), "token", "split", coin_id] + [str(a) for a in amounts] + FLAGS
-    print(f"\nSplit Details:\n--------------\nOriginal Coin: {coin_id}\nOriginal Amount: {total_amount} QUIL")
+    args = ["token", "split", coin_id] + [format_units(a) for a in amounts]
+    print(f"\nSplit Details:\n--------------\nOriginal Coin: {coin_id}\nOriginal Amount: {format_units(total_amount)} QUIL")
     print(f"Number of parts: {len(amounts)}\nSplit amounts:")
     for i, amount in enumerate(amounts, 1):
-        print(f"Part {i}: {amount} QUIL")
-    print(f"Command: {' '.join(cmd)}")
+        print(f"Part {i}: {format_units(amount)} QUIL")
+    print(f"Command: {' '.join(qclient_command(args))}")
     if input("\nProceed with this split? (y/n): ").lower() == 'y':
-        result = subprocess.run(cmd, text=True, capture_output=True)
+        try:
+            result = submit_spend(args, [coin_id])
+        except RuntimeError as e:
+            show_error_and_confirm(str(e))
+            return
         if result.returncode != 0:
             show_error_and_confirm("Split operation failed")
             return
-        wait_with_spinner("Showing your coins in {} secs...", 30)
-        print("\nYour coins after splitting:\n---------------------------")
-        check_coins()
-        print("If you don't see the changes yet, wait and check again from the main menu.")
+        report_confirmation(since_frame, [coin_id])
+        press_any_key()
         main()
     else:
         print("Split operation cancelled.")
@@ -559,27 +2590,32 @@ def token_merge():
         show_error_and_confirm("Wallet encryption check failed")
         return
     print(format_title("Merge Coins"))
-    print("This function allows you to merge either two specific coins or all your coins into a single coin")
+    print("This function allows you to merge two specific coins, all your coins into a single coin,\nor only the small 'dust' coins below an amount of your choice")
     if not confirm_proceed("Merge Coins"):
         main()
         return
     
     while True:
-        print("\nChoose merge option:\n1) Merge two specific coins\n2) Merge all coins")
-        merge_choice = input("Enter your choice (1-2 or 'e' to exit): ")
+        print("\nChoose merge option:\n1) Merge two specific coins\n2) Merge all coins\n3) Consolidate dust (merge all coins below an amount)")
+        merge_choice = input("Enter your choice (1-3 or 'e' to exit): ")
         if merge_choice == 'e':
             print("Operation cancelled.")
             main()
             return
-        if merge_choice in ('1', '2'):
+        if merge_choice in ('1', '2', '3'):
             break
-        error_message("Invalid choice. Please enter 1, 2, or 'e' to exit.")
+        error_message("Invalid choice. Please enter 1, 2, 3, or 'e' to exit.")
+    
+    if merge_choice == '3':
+        consolidate_dust()
+        return
     
     if merge_choice == '1':
         print("\nYour current coins before merging:\n----------------------------------")
-        coins_output = subprocess.run([str(QCLIENT_EXEC), "token", "coins"] + FLAGS, text=True, capture_output=True).stdout
-        print(coins_output)
-        coin_count = len([line for line in coins_output.splitlines() if "QUIL" in line])
+        index = CoinIndex()
+        coin_count, since_frame = render_coins(index=index)
+        if coin_count:
+            cache_coin_index(index)
         if coin_count < 2:
             show_error_and_confirm("Not enough coins to merge. You need at least 2 coins.")
             return
@@ -604,31 +2640,374 @@ def token_merge():
                 break
             error_message("Invalid coin ID format (must be 0x + 64 hex chars)")
         
-        cmd = [str(QCLIENT_EXEC), "token", "merge", left_coin, right_coin] + FLAGS
+        args = ["token", "merge", left_coin, right_coin]
         print(f"\nMerge Details:\n--------------\nFirst Coin: {left_coin}\nSecond Coin: {right_coin}")
-        print(f"Command: {' '.join(cmd)}")
-        if input("\nProceed with this merge? (y/n): ").lower() == 'y':
-            result = subprocess.run(cmd, text=True, capture_output=True)
-            if result.returncode != 0:
-                show_error_and_confirm("Merge operation failed")
-                return
+        print(f"Command: {' '.join(qclient_command(args))}")
+        spent_ids = [left_coin, right_coin]
+        if input("\nProceed with this merge? (y/n): ").lower() != 'y':
+            print("Merge cancelled.")
+            main()
+            return
+        try:
+            result = submit_spend(args, spent_ids)
+        except RuntimeError as e:
+            show_error_and_confirm(str(e))
+            return
+        if result.returncode != 0:
+            show_error_and_confirm("Merge operation failed")
+            return
     else:
-        coin_count = len([line for line in subprocess.run([str(QCLIENT_EXEC), "token", "coins"] + FLAGS, text=True, capture_output=True).stdout.splitlines() if "QUIL" in line])
-        if coin_count < 2:
+        try:
+            index = get_coin_index(refresh=True)
+        except RuntimeError as e:
+            show_error_and_confirm(f"Could not load coins: {e}")
+            return
+        if len(index) < 2:
             show_error_and_confirm("Not enough coins to merge. You need at least 2 coins.")
             return
-        cmd = [str(QCLIENT_EXEC), "token", "merge", "all"] + FLAGS
-        print(f"Command: {' '.join(cmd)}")
-        if input("\nProceed with merging all coins? (y/n): ").lower() == 'y':
-            result = subprocess.run(cmd, text=True, capture_output=True)
-            if result.returncode != 0:
-                show_error_and_confirm("Merge operation failed")
-                return
+        since_frame = index.max_frame()
+        args = ["token", "merge", "all"]
+        print(f"Command: {' '.join(qclient_command(args))}")
+        # Confirmed once every current coin is gone; a reward arriving meanwhile is not a merged coin
+        spent_ids = [index.coin_id(i) for i in range(len(index))]
+        if input("\nProceed with merging all coins? (y/n): ").lower() != 'y':
+            print("Merge cancelled.")
+            main()
+            return
+        try:
+            result = submit_merge_all()
+        except RuntimeError as e:
+            show_error_and_confirm(str(e))
+            return
+        if result.returncode != 0:
+            show_error_and_confirm("Merge operation failed")
+            return
     
-    wait_with_spinner("Showing your coins in {} secs...", 30)
-    print("\nYour coins after merging:\n-------------------------")
-    check_coins()
-    print("If you don't see the changes yet, wait and check again from the main menu.")
+    report_confirmation(since_frame, spent_ids, whole_wallet=merge_choice != '1')
+    press_any_key()
+    main()
+
+# Dust Consolidation
+def plan_dust_batches(index, threshold=DUST_THRESHOLD, batch_size=DUST_BATCH_SIZE, wallet=None):
+    # Smallest coins first, skipping coins reserved by other processes; a single leftover
+    # coin can't be merged on its own and waits for the next run
+    reserved, wallet_reserved = reserved_coins(wallet)
+    if wallet_reserved:
+        return []
+    rows = index.range_of("amount", None, to_units(threshold) - 1)
+    coin_ids = [c for c in (index.coin_id(i) for i in rows) if c not in reserved]
+    batches = [coin_ids[i:i + batch_size] for i in range(0, len(coin_ids), batch_size)]
+    return [batch for batch in batches if len(batch) >= 2]
+
+def submit_merge_batches(batches, wallet=None, progress=None):
+    # Each batch is reserved right before it is submitted. Coins taken by another process in the
+    # meantime are dropped from the batch; the return code is None when nothing was left to merge.
+    results = []
+    with wallet_lock(wallet):
+        for number, batch in enumerate(batches, 1):
+            granted = reserve_coins(batch, wallet)
+            if len(granted) < 2:
+                release_coins(granted, wallet)
+                results.append((batch, None, "skipped, coins reserved by another operation"))
+            else:
+                result = run_qclient(["token", "merge"] + granted, wallet)
+                if result.returncode != 0:
+                    release_coins(granted, wallet)
+                results.append((granted, result.returncode, (result.stderr or result.stdout).strip()))
+            if progress:
+                progress(number, len(batches), results[-1][1])
+    return results
+
+def consolidate_dust():
+    print("\nLoading coins...")
+    try:
+        index = get_coin_index(refresh=True)
+    except RuntimeError as e:
+        show_error_and_confirm(f"Could not load coins: {e}")
+        return
+    while True:
+        threshold = input(f"\nMerge all coins below this amount in QUIL (default {DUST_THRESHOLD}, 'e' to exit): ").strip()
+        if threshold.lower() == 'e':
+            print("Operation cancelled.")
+            main()
+            return
+        try:
+            threshold = float(threshold) if threshold else DUST_THRESHOLD
+        except ValueError:
+            error_message("Invalid amount format")
+            continue
+        if threshold > 0:
+            break
+        error_message("The amount must be greater than 0")
+    batches = plan_dust_batches(index, threshold)
+    dust_count = sum(len(batch) for batch in batches)
+    if not batches:
+        show_error_and_confirm(f"Not enough coins below {threshold} QUIL to merge. You need at least 2.")
+        return
+    dust_total = sum(index.amounts[index.find(coin_id)] for batch in batches for coin_id in batch)
+    print(f"\nDust Consolidation Details:\n---------------------------")
+    print(f"Coins below {threshold} QUIL: {dust_count} of {len(index)}")
+    print(f"Dust total: {format_units(dust_total)} QUIL")
+    print(f"Merge transactions: {len(batches)} (up to {DUST_BATCH_SIZE} coins each)")
+    print("Coins above the threshold are left untouched.")
+    if input("\nProceed with dust consolidation? (y/n): ").lower() != 'y':
+        print("Dust consolidation cancelled.")
+        main()
+        return
+    since_frame = index.max_frame()
+    try:
+        results = submit_merge_batches(batches, progress=lambda n, total, code: print(
+            f"Merge {n}/{total}: {'✅ submitted' if code == 0 else '⏭  skipped (coins reserved)' if code is None else '❌ failed'}"))
+    except RuntimeError as e:
+        show_error_and_confirm(str(e))
+        return
+    failed = [r for r in results if r[1] not in (0, None)]
+    spent_ids = [coin_id for batch, code, _ in results if code == 0 for coin_id in batch]
+    for batch, _, output in failed:
+        error_message(f"Merge of {len(batch)} coins failed: {output}")
+    if not spent_ids:
+        show_error_and_confirm("Dust consolidation failed")
+        return
+    report_confirmation(since_frame, spent_ids)
+    press_any_key()
+    main()
+
+# Batch Operations
+def list_wallets():
+    return list(wallet_registry())
+
+def select_wallets(selection, wallets):
+    # "all", or comma separated wallet numbers, names and glob patterns (e.g. "1,3,node-*")
+    if selection.strip().lower() == "all":
+        return list(wallets)
+    selected = []
+    for part in (p.strip() for p in selection.split(",")):
+        if not part:
+            continue
+        if part.isdigit() and 1 <= int(part) <= len(wallets):
+            matches = [wallets[int(part) - 1]]
+        else:
+            matches = fnmatch.filter(wallets, part)
+        if not matches:
+            raise ValueError(f"No wallet matches '{part}'")
+        selected.extend(m for m in matches if m not in selected)
+    return selected
+
+def batch_balance(wallet, options):
+    result = run_qclient(["token", "balance"], wallet)
+    units, account = parse_balance(result.stdout)
+    if result.returncode != 0 or units is None:
+        return False, (result.stderr or result.stdout).strip() or "Balance check failed"
+    record_wallet_balance(wallet, units, account)
+    return True, f"{format_units(units)} QUIL ({account})" if account else f"{format_units(units)} QUIL"
+
+def batch_merge_all(wallet, options):
+    count, _ = coin_tally(wallet)
+    if count < 2:
+        return True, f"skipped, {count} coin(s)"
+    result = submit_merge_all(wallet)
+    if result.returncode != 0:
+        return False, (result.stderr or result.stdout).strip() or "Merge failed"
+    return True, f"merge of {count} coins submitted"
+
+def batch_dust(wallet, options):
+    batches = plan_dust_batches(load_coin_index(wallet), options.get("threshold", DUST_THRESHOLD),
+                                options.get("batch_size", DUST_BATCH_SIZE), wallet)
+    if not batches:
+        return True, "skipped, no dust to merge"
+    results = submit_merge_batches(batches, wallet)
+    failed = sum(1 for r in results if r[1] not in (0, None))
+    submitted = [r for r in results if r[1] == 0]
+    summary = f"{sum(len(r[0]) for r in submitted)} dust coins in {len(submitted)}/{len(results)} merges submitted"
+    return failed == 0, summary
+
+BATCH_OPERATIONS = {
+    "balance": ("Balance snapshot", batch_balance),
+    "merge-all": ("Merge all coins", batch_merge_all),
+    "dust": ("Consolidate dust", batch_dust),
+}
+
+def run_batch(operation, wallets, options=None, concurrency=None, on_result=None):
+    # One worker per wallet, at most `concurrency` running at once. Returns {wallet: (ok, summary, seconds)}
+    # Without a fixed concurrency, QCLIENT_LIMITER decides how many qclient calls run in parallel.
+    _, func = BATCH_OPERATIONS[operation]
+    options = options or {}
+
+    def worker(wallet):
+        start = time.perf_counter()
+        try:
+            ok, summary = func(wallet, options)
+        except Exception as e:
+            ok, summary = False, str(e)
+        return wallet, ok, summary, time.perf_counter() - start
+
+    results = {}
+    for wallet, ok, summary, seconds in run_parallel(worker, wallets, concurrency):
+        results[wallet] = (ok, summary, seconds)
+        if on_result:
+            on_result(wallet, ok, summary, seconds)
+    return results
+
+def print_batch_summary(results):
+    width = max([len(w) for w in results] + [6])
+    print(f"\n{'WALLET':<{width}}  {'RESULT':<6}  {'TIME':>7}  DETAILS")
+    for wallet in sorted(results):
+        ok, summary, seconds = results[wallet]
+        print(f"{wallet:<{width}}  {'OK' if ok else 'FAILED':<6}  {seconds:>6.1f}s  {summary}")
+    failed = sum(1 for ok, _, _ in results.values() if not ok)
+    print(f"\n{len(results) - failed} succeeded, {failed} failed")
+    print(format_concurrency(QCLIENT_LIMITER.stats()))
+
+def bulk_wallet_names(pattern, count, start=1):
+    # "node-###" numbers the '#' run with zero padding (node-001, node-002, ...); without '#', "-N" is appended
+    match = re.search(r"#+", pattern)
+    if match:
+        names = [f"{pattern[:match.start()]}{n:0{len(match.group())}d}{pattern[match.end():]}" for n in range(start, start + count)]
+    else:
+        names = [f"{pattern}-{n}" for n in range(start, start + count)]
+    invalid = [n for n in names if not re.match(r"^[a-z0-9_-]+$", n)]
+    if invalid:
+        raise ValueError(f"Invalid wallet name '{invalid[0]}'. Use only lowercase letters, numbers, dashes, underscores")
+    return names
+
+def create_wallets(names, concurrency=None, on_result=None):
+    # Creates the wallet directories, then lets qclient generate the keys with a first balance call.
+    # The balance calls run in a bounded pool and record each new address in the wallet registry.
+    existing = [n for n in names if (WALLETS_DIR / n).exists()]
+    if existing:
+        raise ValueError(f"Wallet '{existing[0]}' already exists")
+    for name in names:
+        (WALLETS_DIR / name / ".config").mkdir(parents=True)
+    return run_batch("balance", names, concurrency=concurrency, on_result=on_result)
+
+def export_wallet_addresses(wallets, fmt, out):
+    registry = wallet_registry()
+    if fmt == "json":
+        json.dump({name: registry.get(name, {}).get("address") for name in wallets}, out, indent=2)
+        out.write("\n")
+    else:
+        writer = csv.writer(out)
+        writer.writerow(["name", "address"])
+        writer.writerows([name, registry.get(name, {}).get("address") or ""] for name in wallets)
+
+def export_format(path, fmt=None):
+    return fmt or ("json" if str(path).lower().endswith(".json") else "csv")
+
+# Streaming Export
+# Records are written one at a time as qclient produces them, so memory use does not grow with the
+# number of coins. Output is flushed every RENDER_BATCH_LINES records to keep pipes moving.
+COIN_EXPORT_FIELDS = ("wallet", "coin_id", "amount", "frame", "timestamp")
+BALANCE_EXPORT_FIELDS = ("wallet", "account", "amount", "timestamp", "error")
+
+class RecordWriter:
+    def __init__(self, out, fmt, fields):
+        self.out = out
+        self.fmt = fmt
+        self.fields = fields
+        self.count = 0
+        if fmt == "csv":
+            self.csv = csv.writer(out)
+            self.csv.writerow(fields)
+
+    def write(self, record):
+        if self.fmt == "csv":
+            self.csv.writerow("" if record.get(f) is None else record[f] for f in self.fields)
+        else:
+            self.out.write(json.dumps(record) + "\n")
+        self.count += 1
+        if self.count % RENDER_BATCH_LINES == 0:
+            self.out.flush()
+
+def export_coins(wallets, writer, metadata=True):
+    # Returns {wallet: error} for the wallets whose coins could not be listed
+    errors = {}
+    for wallet in wallets:
+        stream = QclientStream(["token", "coins", "metadata"] if metadata else ["token", "coins"], wallet)
+        for coin_id, units, frame, timestamp in parse_coins(stream):
+            writer.write({"wallet": wallet, "coin_id": coin_id, "amount": format_units(units), "frame": frame, "timestamp": timestamp})
+        if stream.returncode != 0:
+            errors[wallet] = stream.stderr.strip() or f"qclient exited with code {stream.returncode}"
+    return errors
+
+def export_balances(wallets, writer, concurrency=None):
+    def fetch(wallet):
+        result = run_qclient(["token", "balance"], wallet)
+        units, account = parse_balance(result.stdout)
+        record = {"wallet": wallet, "account": account, "amount": None if units is None else format_units(units),
+                  "timestamp": format_timestamp(time.time())}
+        if result.returncode != 0 or units is None:
+            record["error"] = (result.stderr or result.stdout).strip() or "Balance check failed"
+        else:
+            record_wallet_balance(wallet, units, account)
+        return record
+
+    errors = {}
+    for record in run_parallel(fetch, wallets, concurrency):
+        writer.write(record)
+        if "error" in record:
+            errors[record["wallet"]] = record["error"]
+    return errors
+
+def batch_operations():
+    if not check_wallet_encryption():
+        show_error_and_confirm("Wallet encryption check failed")
+        return
+    print(format_title("Batch Operations"))
+    print("Apply one operation to several wallets at once. The number of wallets processed in parallel\n"
+          "adapts to how fast the RPC responds.")
+    wallets = list_wallets()
+    if not wallets:
+        show_error_and_confirm("No valid wallets found")
+        return
+    operations = list(BATCH_OPERATIONS)
+    while True:
+        print("\nChoose operation:")
+        for i, name in enumerate(operations, 1):
+            print(f"{i}) {BATCH_OPERATIONS[name][0]}")
+        choice = input(f"Enter your choice (1-{len(operations)} or 'e' to exit): ")
+        if choice.lower() == 'e':
+            print("Operation cancelled.")
+            main()
+            return
+        if choice.isdigit() and 1 <= int(choice) <= len(operations):
+            operation = operations[int(choice) - 1]
+            break
+        error_message(f"Invalid choice. Please enter 1-{len(operations)} or 'e' to exit.")
+    print("\nAvailable wallets:\n-----------------")
+    for i, w in enumerate(wallets, 1):
+        print(f"{i}) {w}")
+    while True:
+        selection = input("\nSelect wallets: 'all', numbers or name patterns separated by comma, e.g. 1,3,node-* (or 'e' to exit): ")
+        if selection.lower() == 'e':
+            print("Operation cancelled.")
+            main()
+            return
+        try:
+            selected = select_wallets(selection, wallets)
+        except ValueError as e:
+            error_message(str(e))
+            continue
+        if selected:
+            break
+        error_message("No wallets selected")
+    options = {}
+    if operation == "dust":
+        threshold = input(f"Merge coins below this amount in QUIL (default {DUST_THRESHOLD}): ").strip()
+        try:
+            options["threshold"] = float(threshold) if threshold else DUST_THRESHOLD
+        except ValueError:
+            show_error_and_confirm("Invalid amount format")
+            return
+    print(f"\n{BATCH_OPERATIONS[operation][0]} on {len(selected)} wallet(s): {', '.join(selected)}")
+    if operation != "balance" and input("\nProceed? (y/n): ").lower() != 'y':
+        print("Operation cancelled.")
+        main()
+        return
+    print()
+    results = run_batch(operation, selected, options, on_result=lambda w, ok, summary, seconds: print(
+        f"{'✅' if ok else '❌'} {w}: {summary}"))
+    print_batch_summary(results)
+    press_any_key()
     main()
 
 def create_new_wallet():
@@ -637,12 +3016,16 @@ def create_new_wallet():
         show_error_and_confirm("Wallet encryption check failed")
         return
     print(format_title("Create Wallet"))
+    print("Use # in the name to create several numbered wallets at once, e.g. node-### for node-001, node-002, ...")
     while True:
         new_wallet = input("\nEnter new wallet name (or 'e' to exit): ")
         if new_wallet.lower() == 'e':
             print("Operation cancelled.")
             main()
             return
+        if "#" in new_wallet:
+            create_wallet_batch(new_wallet)
+            return
         if not re.match(r"^[a-z0-9_-]+$", new_wallet):
             error_message("Invalid wallet name. Use only lowercase letters, numbers, dashes, underscores")
             continue
@@ -661,30 +3044,46 @@ def create_new_wallet():
         main()
         return
 
+def create_wallet_batch(pattern):
+    while True:
+        count = input("How many wallets? ").strip()
+        if count.isdigit() and int(count) > 0:
+            break
+        error_message("Please enter a positive number")
+    try:
+        names = bulk_wallet_names(pattern, int(count))
+        print(f"\nCreating {len(names)} wallets ({names[0]} ... {names[-1]})...")
+        results = create_wallets(names, on_result=lambda w, ok, summary, seconds: print(f"{'✅' if ok else '❌'} {w}: {summary}"))
+    except (ValueError, OSError) as e:
+        show_error_and_confirm(str(e))
+        return
+    print_batch_summary(results)
+    path = input("\nSave names and addresses to a .csv or .json file (Enter to skip): ").strip()
+    if path:
+        try:
+            with open(Path(path).expanduser(), "w", newline="") as f:
+                export_wallet_addresses(names, export_format(path), f)
+            print(f"✅ Saved to {path}")
+        except OSError as e:
+            error_message(f"Could not save file: {e}")
+    press_any_key()
+    main()
+
 def switch_wallet():
     global WALLET_NAME, FLAGS
     if not check_wallet_encryption():
         show_error_and_confirm("Wallet encryption check failed")
         return
     print(format_title("Switch Wallet"))
-    wallets = [d.name for d in WALLETS_DIR.iterdir() if (d / ".config").exists()]
-    if not wallets:
+    if not list_wallets():
         show_error_and_confirm("No valid wallets found")
         return
     while True:
-        print("\nAvailable wallets:\n-----------------")
-        for i, w in enumerate(wallets, 1):
-            suffix = " (current)" if w == WALLET_NAME else ""
-            print(f"{i}) {w}{suffix}")
-        selection = input(f"\nSelect wallet number (1-{len(wallets)} or 'e' to exit): ")
-        if selection.lower() == 'e':
+        new_wallet = pick_wallet("switch to")
+        if new_wallet is None:
             print("Operation cancelled.")
             main()
             return
-        if not selection.isdigit() or not 1 <= int(selection) <= len(wallets):
-            error_message(f"Invalid selection. Choose 1-{len(wallets)}")
-            continue
-        new_wallet = wallets[int(selection) - 1]
         if new_wallet == WALLET_NAME:
             error_message("Already using this wallet")
             continue
@@ -705,24 +3104,15 @@ def delete_wallet():
     if not confirm_proceed("Delete Wallet", description):
         main()
         return
-    wallets = [d.name for d in WALLETS_DIR.iterdir() if (d / ".config").exists()]
-    if not wallets:
+    if not list_wallets():
         show_error_and_confirm("No valid wallets found")
         return
     while True:
-        print("\nAvailable wallets:\n-----------------")
-        for i, w in enumerate(wallets, 1):
-            suffix = " (current)" if w == WALLET_NAME else ""
-            print(f"{i}) {w}{suffix}")
-        selection = input(f"\nSelect wallet number to delete (1-{len(wallets)} or 'e' to exit): ")
-        if selection.lower() == 'e':
+        selected_wallet = pick_wallet("delete")
+        if selected_wallet is None:
             print("Operation cancelled.")
             main()
             return
-        if not selection.isdigit() or not 1 <= int(selection) <= len(wallets):
-            error_message(f"Invalid selection. Choose 1-{len(wallets)}")
-            continue
-        selected_wallet = wallets[int(selection) - 1]
         if selected_wallet == WALLET_NAME:
             error_message("Cannot delete the currently active wallet. Switch first.")
             continue
@@ -820,11 +3210,20 @@ COIN MANAGEMENT
     Display detailed information about each coin in your wallet including amounts and metadata
 
 7 - Merge Coins
-    Combine multiple coins into a single coin. You can merge two specific coins or all coins at once
+    Combine multiple coins into a single coin. You can merge two specific coins, all coins at once,
+    or only the dust coins below an amount (merged in batches, larger coins are left alone)
 
 8 - Split Coins
     Divide a single coin into multiple coins with specified amounts
 
+9 - Query Coins
+    Sort coins by amount or frame, filter by amount range or ID prefix,
+    show the largest/smallest coins and count/sum/histogram summaries
+
+B - Batch Operations
+    Run a balance snapshot, merge all or dust consolidation on several wallets in parallel
+    and get a per-wallet result summary
+
 WALLET MANAGEMENT
 -----------------
 10 - Create New Wallet
@@ -842,6 +3241,15 @@ WALLET MANAGEMENT
 14 - Delete Wallet
      Remove a wallet and all its associated files (cannot be undone)
 
+QCLIENT
+-------
+U - Check for Updates
+    Download the newest Qclient release (skipped while a version is pinned)
+
+R - Qclient Versions / Rollback
+    Pin any of the retained Qclient versions, roll back to the previous one, or unpin to
+    follow the newest release again. Set how many versions are kept before older ones are pruned
+
 Note: Always ensure you have backups of your wallet configurations
       and never share your private keys or configuration files.
 """)
@@ -898,18 +3306,85 @@ Use this script at your own risk and always verify transactions before confirmin
 """)
     press_any_key()
 
+def show_metrics():
+    print(format_title("Qclient & RPC Metrics"))
+    rows = METRICS.summary()
+    if not rows:
+        print("No qclient or HTTP calls recorded yet.")
+    else:
+        print(f"Latency over the last {METRICS_WINDOW} calls:\n")
+        print(f"{'TYPE':<8}{'COMMAND':<20}{'CALLS':>6}{'FAIL':>6}{'P50':>9}{'P95':>9}{'MAX':>9}{'BYTES':>12}")
+        for row in rows:
+            print(f"{row['kind']:<8}{row['command']:<20}{row['calls']:>6}{row['failures']:>6}"
+                  f"{row['p50']:>8.2f}s{row['p95']:>8.2f}s{row['max']:>8.2f}s{row['bytes']:>12}")
+    print("\n" + format_concurrency(QCLIENT_LIMITER.stats()))
+    if METRICS.textfile:
+        print(f"\nPrometheus textfile: {METRICS.textfile}")
+    press_any_key()
+
+def script_version(text):
+    match = re.search(r'^SCRIPT_VERSION = "([^"]+)"', text, re.MULTILINE)
+    return match.group(1) if match else None
+
+def latest_script_version():
+    # Within UPDATE_CHECK_INTERVAL of the last check the stored answer is used without any network
+    # access. Otherwise a conditional GET is made; a newer script is kept in UPDATE_BODY_FILE so
+    # installing it later needs no second download.
+    try:
+        state = json.loads(UPDATE_STATE_FILE.read_text())
+    except (OSError, ValueError):
+        state = {}
+    if state.get("url") != UPDATE_URL:
+        # Answers and ETags from another URL say nothing about this one
+        state = {}
+    now = time.time()
+    interval = state.get("interval", UPDATE_CHECK_INTERVAL)
+    latest = state.get("latest_version")
+    if latest and 0 <= now - state.get("checked", 0) < interval and (not version_gt(latest, SCRIPT_VERSION) or UPDATE_BODY_FILE.exists()):
+        return latest
+    headers = {}
+    # The ETag only stands for content we still have: either nothing newer, or the saved body
+    if state.get("etag") and (not version_gt(state.get("latest_version") or "0", SCRIPT_VERSION) or UPDATE_BODY_FILE.exists()):
+        headers["If-None-Match"] = state["etag"]
+    response = http_get(UPDATE_URL, "update_check", headers=headers, timeout=10)
+    if response.status_code != 304:
+        response.raise_for_status()
+        latest = script_version(response.text)
+        if not latest:
+            raise RuntimeError("No SCRIPT_VERSION found in the remote script")
+        if version_gt(latest, SCRIPT_VERSION):
+            tmp = UPDATE_BODY_FILE.with_name(f".{UPDATE_BODY_FILE.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(response.content)
+            os.replace(tmp, UPDATE_BODY_FILE)
+        state = {"url": UPDATE_URL, "etag": response.headers.get("ETag"), "latest_version": latest}
+    state["checked"] = now
+    if interval != UPDATE_CHECK_INTERVAL:
+        state["interval"] = interval
+    tmp = UPDATE_STATE_FILE.with_name(f".{UPDATE_STATE_FILE.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, UPDATE_STATE_FILE)
+    return state["latest_version"]
+
+def install_script_update(latest_version):
+    body = UPDATE_BODY_FILE.read_bytes()
+    if script_version(body.decode("utf-8", "replace")) != latest_version:
+        UPDATE_BODY_FILE.unlink()
+        raise RuntimeError("Downloaded update is incomplete, it will be fetched again on the next check")
+    script = Path(__file__).resolve()
+    tmp = script.with_name(f".{script.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(body)
+    shutil.copymode(script, tmp)
+    os.replace(tmp, script)
+    UPDATE_BODY_FILE.unlink()
 
 def check_for_updates():
     try:
-        latest_version = re.search(r'SCRIPT_VERSION="([^"]+)"', 
-                                 requests.get("https://raw.githubusercontent.com/lamat1111/Q1-Wallet/main/menu.sh").text).group(1)
+        latest_version = latest_script_version()
         print(f"\nCurrent local version: {SCRIPT_VERSION}\nLatest remote version: {latest_version}")
         if version_gt(latest_version, SCRIPT_VERSION):
             warning_message("A new version is available!")
             if input("\nUpdate now? (y/n): ").lower() == 'y':
-                response = requests.get("https://raw.githubusercontent.com/lamat1111/Q1-Wallet/main/menu.sh")
-                with open(__file__, 'w') as f:
-                    f.write(response.text)
+                install_script_update(latest_version)
                 print("✅ Updated. Restarting...")
                 os.execv(sys.executable, [sys.executable] + sys.argv)
         else:
@@ -918,50 +3393,358 @@ def check_for_updates():
         error_message(f"Update check failed: {e}")
     # Removed press_any_key() to auto-proceed to menu
 
+# Action Profiling
+def start_action_profile(action_name):
+    global ACTIVE_PROFILE
+    stop_action_profile()
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    ACTIVE_PROFILE = (action_name, profiler, time.time(), time.perf_counter())
+    profiler.enable()
+
+def stop_action_profile():
+    # Menu actions end by re-entering main(), so the profile is closed from there
+    global ACTIVE_PROFILE
+    if ACTIVE_PROFILE is None:
+        return
+    action_name, profiler, started, start = ACTIVE_PROFILE
+    ACTIVE_PROFILE = None
+    profiler.disable()
+    elapsed = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    base = PROFILES_DIR / f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}-{action_name}"
+    profiler.dump_stats(str(base.with_suffix(".prof")))
+    stats_output = io.StringIO()
+    pstats.Stats(profiler, stream=stats_output).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    with open(base.with_suffix(".txt"), "w") as f:
+        f.write(f"Action: {action_name}\nWallet: {WALLET_NAME}\nWall time: {elapsed:.3f}s\nPeak traced memory: {peak / 1024 / 1024:.1f} MiB\n\n")
+        f.write(f"Top {PROFILE_TOP_N} allocations by line:\n")
+        for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N]:
+            f.write(f"{stat}\n")
+        f.write(f"\nTop {PROFILE_TOP_N} functions by cumulative time:\n")
+        f.write(stats_output.getvalue())
+    print(f"\nProfile saved: {base.with_suffix('.prof')} ({elapsed:.2f}s, peak {peak / 1024 / 1024:.1f} MiB)")
+
+def toggle_profiling():
+    global PROFILING
+    PROFILING = not PROFILING
+    if PROFILING:
+        print(f"\n✅ Profiling enabled. Each menu action will be profiled into {PROFILES_DIR}")
+    else:
+        print("\n✅ Profiling disabled.")
+    press_any_key()
+
 # Main Menu Loop
+MENU_ACTIONS = {
+    '1': ("check_balance", check_balance),
+    '2': ("create_transaction", create_transaction),
+    '6': ("check_coins", check_coins),
+    '7': ("token_merge", token_merge),
+    '8': ("token_split", token_split_advanced),
+    '9': ("coin_query", coin_query),
+    'b': ("batch_operations", batch_operations),
+    '10': ("create_new_wallet", create_new_wallet),
+    '11': ("import_wallet", import_wallet),
+    '12': ("switch_wallet", switch_wallet),
+    '13': ("encrypt_decrypt_wallets", encrypt_decrypt_wallets),
+    '14': ("delete_wallet", delete_wallet),
+    'u': ("check_qclient_version", check_qclient_version),
+    'r': ("release_manager", release_manager),
+    's': ("security_settings", security_settings),
+    'd': ("donations", donations),
+    'x': ("disclaimer", disclaimer),
+    'h': ("help_menu", help_menu),
+    'm': ("show_metrics", show_metrics),
+}
+
 def main():
     while True:
+        stop_action_profile()
         display_menu()
         choice = input("Enter your choice: ").lower()
-        if choice == '1':
-            check_balance()
-        elif choice == '2':
-            create_transaction()
-        elif choice == '6':
-            check_coins()
-        elif choice == '7':
-            token_merge()
-        elif choice == '8':
-            token_split_advanced()
-        elif choice == '10':
-            create_new_wallet()
-        elif choice == '11':
-            import_wallet()
-        elif choice == '12':
-            switch_wallet()
-        elif choice == '13':
-            encrypt_decrypt_wallets()
-        elif choice == '14':
-            delete_wallet()
-        elif choice == 'u':
-            check_qclient_version()
-        elif choice == 's':
-            security_settings()
-        elif choice == 'd':
-            donations()
-        elif choice == 'x':
-            disclaimer()
-        elif choice == 'h':
-            help_menu()
-        elif choice == 'e':
+        if choice == 'e':
             print("\nExiting...")
             sys.exit(0)
+        elif choice == 'p':
+            toggle_profiling()
+        elif choice in MENU_ACTIONS:
+            action_name, action = MENU_ACTIONS[choice]
+            if PROFILING:
+                start_action_profile(action_name)
+            action()
         else:
             print("Invalid option, please try again.")
             press_any_key()
 
+# Command Line Interface
+def cli_coins(args):
+    try:
+        sys.stdout.write(run_coin_query(args, args.wallet))
+    except RuntimeError as e:
+        error_message(f"Could not load coins: {e}")
+        return 1
+    return 0
+
+def cli_dust(args):
+    if args.batch_size < 2:
+        error_message("--batch-size must be at least 2")
+        return 1
+    try:
+        index = load_coin_index(args.wallet)
+    except RuntimeError as e:
+        error_message(f"Could not load coins: {e}")
+        return 1
+    batches = plan_dust_batches(index, args.threshold, args.batch_size, args.wallet)
+    print(f"{sum(len(b) for b in batches)} coins below {args.threshold} QUIL in {len(batches)} merge batches")
+    if not batches or not args.yes:
+        if batches:
+            print("Dry run. Add --yes to submit the merges.")
+        return 0
+    try:
+        results = submit_merge_batches(batches, args.wallet, progress=lambda n, total, code: print(
+            f"Merge {n}/{total}: {'submitted' if code == 0 else 'skipped (coins reserved)' if code is None else 'failed'}"))
+    except RuntimeError as e:
+        error_message(str(e))
+        return 1
+    failed = [r for r in results if r[1] not in (0, None)]
+    for batch, _, output in failed:
+        error_message(f"Merge of {len(batch)} coins failed: {output}")
+    return 1 if failed else 0
+
+def cli_batch(args):
+    wallets = list_wallets()
+    try:
+        selected = select_wallets(args.wallets, wallets)
+    except ValueError as e:
+        error_message(str(e))
+        return 1
+    if not selected:
+        error_message("No wallets selected")
+        return 1
+    if args.operation != "balance" and not args.yes:
+        print(f"{BATCH_OPERATIONS[args.operation][0]} would run on: {', '.join(selected)}")
+        print("Dry run. Add --yes to run it.")
+        return 0
+    options = {"threshold": args.threshold, "batch_size": args.batch_size}
+    results = run_batch(args.operation, selected, options, args.concurrency,
+                        on_result=lambda w, ok, summary, seconds: print(f"{'OK' if ok else 'FAILED'} {w}: {summary}", flush=True))
+    print_batch_summary(results)
+    return 0 if all(ok for ok, _, _ in results.values()) else 1
+
+def cli_create(args):
+    try:
+        names = bulk_wallet_names(args.pattern, args.count, args.start)
+        results = create_wallets(names, args.concurrency, on_result=lambda w, ok, summary, seconds: print(
+            f"{'OK' if ok else 'FAILED'} {w}: {summary}", file=sys.stderr, flush=True))
+    except (ValueError, OSError) as e:
+        error_message(str(e))
+        return 1
+    write_address_export(names, args)
+    return 0 if all(ok for ok, _, _ in results.values()) else 1
+
+def cli_addresses(args):
+    try:
+        selected = select_wallets(args.wallets, list_wallets())
+    except ValueError as e:
+        error_message(str(e))
+        return 1
+    registry = wallet_registry()
+    missing = [w for w in selected if not registry[w].get("address")]
+    if missing and args.refresh:
+        run_batch("balance", missing, concurrency=args.concurrency)
+    write_address_export(selected, args)
+    return 0
+
+def write_address_export(wallets, args):
+    fmt = export_format(args.output or "", args.format)
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            export_wallet_addresses(wallets, fmt, f)
+    else:
+        export_wallet_addresses(wallets, fmt, sys.stdout)
+
+def cli_export(args):
+    try:
+        selected = select_wallets(args.wallets or args.wallet or WALLET_NAME, list_wallets())
+    except ValueError as e:
+        error_message(str(e))
+        return 1
+    fields = COIN_EXPORT_FIELDS if args.kind == "coins" else BALANCE_EXPORT_FIELDS
+    fmt = args.format or ("csv" if (args.output or "").lower().endswith(".csv") else "ndjson")
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = RecordWriter(out, fmt, fields)
+        if args.kind == "coins":
+            errors = export_coins(selected, writer, not args.no_metadata)
+        else:
+            errors = export_balances(selected, writer, args.concurrency)
+        out.flush()
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head), which is not an error
+        sys.stdout = None
+        return 0
+    finally:
+        if args.output:
+            out.close()
+    for wallet, error in errors.items():
+        error_message(f"{wallet}: {error}")
+    if args.output:
+        print(f"✅ Exported {writer.count} records to {args.output}", file=sys.stderr)
+    return 1 if errors else 0
+
+def cli_history(args):
+    try:
+        selected = select_wallets(args.wallets or args.wallet or WALLET_NAME, list_wallets())
+    except ValueError as e:
+        error_message(str(e))
+        return 1
+    start = time.time() - args.days * 86400
+    width = max([len(w) for w in selected] + [6])
+    for wallet in selected:
+        if args.samples:
+            for ts, units in BalanceHistory(wallet).query(start, resolution=args.resolution):
+                print(f"{wallet}\t{format_timestamp(ts)}\t{format_units(units)}")
+        else:
+            print(f"{wallet:<{width}}  {format_history(wallet, args.days, args.width) or 'not enough samples'}")
+    return 0
+
+def cli_qclient(args):
+    try:
+        if args.action == "pin":
+            if not args.version:
+                raise ValueError("pin needs a version, e.g. 'qclient pin 2.1.0.1'")
+            pin_release(args.version)
+        elif args.action == "unpin":
+            pin_release(None)
+        elif args.action == "rollback":
+            rollback_release()
+        elif args.action == "prune":
+            if args.keep:
+                policy = load_release_policy()
+                policy["keep"] = args.keep
+                save_release_policy(policy)
+            prune_releases()
+    except ValueError as e:
+        error_message(str(e))
+        return 1
+    print_releases()
+    return 0
+
+def cli_daemon(args):
+    if args.status or args.stop:
+        try:
+            if args.stop:
+                daemon_request("shutdown")
+                print("Daemon stopping.")
+            else:
+                status = daemon_request("ping")
+                print(f"Daemon running: pid {status['pid']}, up {status['uptime']:.0f}s, version {status['version']}")
+                verification = status["verification"]
+                print(f"Qclient: {status['qclient']} ({verification['status']}, {verification['signatures']} signatures)")
+                print(f"Cached results: {status['cached']}, coin indexes: {', '.join(status['indexes']) or 'none'}")
+                print(format_concurrency(status["concurrency"]))
+        except DaemonUnavailable:
+            print("Daemon is not running.")
+            return 1
+        except RuntimeError as e:
+            error_message(f"Daemon is not answering: {e}")
+            return 1
+        return 0
+    return run_daemon()
+
+def parse_cli_args(argv=None):
+    parser = argparse.ArgumentParser(description="Q1 Wallet - a CLI wallet to manage $QUIL tokens")
+    parser.add_argument("--profile", action="store_true", help=f"profile every menu action into {PROFILES_DIR}")
+    wallet_parser = argparse.ArgumentParser(add_help=False)
+    wallet_parser.add_argument("--wallet", help="wallet to use instead of the current one")
+    subparsers = parser.add_subparsers(dest="command")
+    coins_parser = subparsers.add_parser("coins", parents=[coin_query_parser(), wallet_parser], add_help=False,
+                                         help="filter, sort and summarize coins")
+    coins_parser.set_defaults(func=cli_coins)
+    dust_parser = subparsers.add_parser("dust", parents=[wallet_parser], help="merge all coins below an amount")
+    dust_parser.add_argument("--threshold", type=float, default=DUST_THRESHOLD, help=f"amount in QUIL (default: {DUST_THRESHOLD})")
+    dust_parser.add_argument("--batch-size", type=int, default=DUST_BATCH_SIZE, help=f"coins per merge (default: {DUST_BATCH_SIZE})")
+    dust_parser.add_argument("--yes", action="store_true", help="submit the merges instead of only showing the plan")
+    dust_parser.set_defaults(func=cli_dust)
+    batch_parser = subparsers.add_parser("batch", help="run one operation on many wallets in parallel")
+    batch_parser.add_argument("operation", choices=list(BATCH_OPERATIONS))
+    batch_parser.add_argument("--wallets", default="all", help="'all' or comma separated names/glob patterns (default: all)")
+    batch_parser.add_argument("--concurrency", type=int, help=f"wallets processed in parallel (default: adaptive, up to {QCLIENT_CONCURRENCY_MAX})")
+    batch_parser.add_argument("--threshold", type=float, default=DUST_THRESHOLD, help="dust threshold in QUIL")
+    batch_parser.add_argument("--batch-size", type=int, default=DUST_BATCH_SIZE, help="coins per dust merge")
+    batch_parser.add_argument("--yes", action="store_true", help="run merges instead of only listing the wallets")
+    batch_parser.set_defaults(func=cli_batch)
+    address_output_parser = argparse.ArgumentParser(add_help=False)
+    address_output_parser.add_argument("--format", choices=("csv", "json"), help="output format (default: from the --output extension, else csv)")
+    address_output_parser.add_argument("--output", help="write names and addresses to this file instead of stdout")
+    address_output_parser.add_argument("--concurrency", type=int, help=f"qclient calls in parallel (default: adaptive, up to {QCLIENT_CONCURRENCY_MAX})")
+    create_parser = subparsers.add_parser("create", parents=[address_output_parser], help="create many numbered wallets and export their addresses")
+    create_parser.add_argument("pattern", help="wallet name with a run of # for the number, e.g. node-###")
+    create_parser.add_argument("--count", type=int, required=True, help="number of wallets to create")
+    create_parser.add_argument("--start", type=int, default=1, help="first number (default: 1)")
+    create_parser.set_defaults(func=cli_create)
+    addresses_parser = subparsers.add_parser("addresses", parents=[address_output_parser], help="export wallet names and addresses")
+    addresses_parser.add_argument("--wallets", default="all", help="'all' or comma separated names/glob patterns (default: all)")
+    addresses_parser.add_argument("--refresh", action="store_true", help="look up addresses that are not cached yet")
+    addresses_parser.set_defaults(func=cli_addresses)
+    export_parser = subparsers.add_parser("export", parents=[wallet_parser], help="stream coins or balances as NDJSON or CSV")
+    export_parser.add_argument("kind", choices=("coins", "balances"))
+    export_parser.add_argument("--wallets", help="'all' or comma separated names/glob patterns (default: --wallet or the current wallet)")
+    export_parser.add_argument("--format", choices=("ndjson", "csv"), help="output format (default: from the --output extension, else ndjson)")
+    export_parser.add_argument("--output", help="write to this file instead of stdout")
+    export_parser.add_argument("--no-metadata", action="store_true", help="skip frame and timestamp, which makes qclient faster")
+    export_parser.add_argument("--concurrency", type=int, help=f"balances fetched in parallel (default: adaptive, up to {QCLIENT_CONCURRENCY_MAX})")
+    export_parser.set_defaults(func=cli_export)
+    history_parser = subparsers.add_parser("history", parents=[wallet_parser], help="show recorded balance history")
+    history_parser.add_argument("--wallets", help="'all' or comma separated names/glob patterns (default: --wallet or the current wallet)")
+    history_parser.add_argument("--days", type=float, default=30, help="how far back to look (default: 30)")
+    history_parser.add_argument("--resolution", choices=[r[0] for r in HISTORY_RESOLUTIONS], help="default: the finest one covering --days")
+    history_parser.add_argument("--width", type=int, default=40, help="sparkline width (default: 40)")
+    history_parser.add_argument("--samples", action="store_true", help="print the samples instead of a sparkline")
+    history_parser.set_defaults(func=cli_history)
+    qclient_parser = subparsers.add_parser("qclient", help="list, pin or roll back the installed Qclient versions")
+    qclient_parser.add_argument("action", choices=("list", "pin", "unpin", "rollback", "prune"))
+    qclient_parser.add_argument("version", nargs="?", help="version to pin, e.g. 2.1.0.1")
+    qclient_parser.add_argument("--keep", type=int, help="with prune: set how many versions to keep")
+    qclient_parser.set_defaults(func=cli_qclient)
+    daemon_parser = subparsers.add_parser("daemon", help="serve wallet state to other menu/CLI processes over a Unix socket")
+    daemon_parser.add_argument("--status", action="store_true", help="show whether a daemon is running")
+    daemon_parser.add_argument("--stop", action="store_true", help="stop the running daemon")
+    daemon_parser.set_defaults(func=cli_daemon)
+    return parser.parse_args(argv)
+
+def run_cli_command(args):
+    global QCLIENT_EXEC
+    if args.command == "daemon" and (args.status or args.stop):
+        return args.func(args)
+    # Resolved even with a daemon running: only run_qclient and coin queries go through the daemon,
+    # streamed listings and WalletClient calls start qclient in this process
+    QCLIENT_EXEC = find_qclient_binary()
+    if not QCLIENT_EXEC:
+        error_message(f"No Qclient found in: {QCLIENT_DIR}. Run the menu once to download it.")
+        return 1
+    # A mismatching binary still allows switching to another version
+    if not check_binary_integrity(sys.stderr) and args.command != "qclient":
+        return 1
+    if not check_wallet_encryption():
+        return 1
+    setup_initial_wallet()
+    wallet = getattr(args, "wallet", None)
+    if wallet and not (WALLETS_DIR / wallet / ".config").exists():
+        error_message(f"Wallet '{wallet}' not found")
+        return 1
+    return args.func(args)
+
 # Run
 if __name__ == "__main__":
+    cli_args = parse_cli_args()
+    PROFILING = cli_args.profile
+    if cli_args.command:
+        sys.exit(run_cli_command(cli_args))
     if not check_qclient_binary():
         sys.exit(1)
     setup_initial_wallet()
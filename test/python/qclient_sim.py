@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+
+# Offline qclient simulator for the Q1 Wallet (Python Edition)
+#
+# Implements the subset of qclient used by menu.py against a local state
+# directory, so the menu can be exercised and benchmarked without the real
+# binary or network access:
+#
+#   token balance
+#   token coins [metadata]
+#   token transfer <to_address> <coin_id>
+#   token merge <coin_id> <coin_id> [...] | all
+#   token split <coin_id> <amount> <amount> [...]
+#
+# Install it next to menu.py under the qclient name pattern, so that
+# find_qclient_binary() picks it up:
+#
+#   python3 qclient_sim.py sim install /path/to/q1wallet
+#
+# Behaviour is tuned with environment variables:
+#
+#   QCLIENT_SIM_LATENCY        seconds per call, or a "min-max" range (default 0)
+#   QCLIENT_SIM_FAILURE_RATE   probability (0-1) that a call fails with an RPC error (default 0)
+#   QCLIENT_SIM_CONFIRM_DELAY  seconds before transfers/merges/splits show up in coins (default 0)
+#   QCLIENT_SIM_COINS          number of coins a fresh wallet is seeded with (default 10)
+#   QCLIENT_SIM_SEED           seed for deterministic coin generation (default: the config path)
+#   QCLIENT_SIM_STATE          state directory override (default: <config>/qclient-sim)
+
+import os
+import sys
+import json
+import time
+import random
+import struct
+import hashlib
+import platform
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Constants
+SIM_VERSION = "0.0.0.1"
+UNITS_PER_QUIL = 10 ** 12
+FRAME_SECONDS = 10
+GENESIS_TIME = 1700000000
+# coin_id (32 bytes), amount in units, frame number, unix timestamp
+COIN_RECORD = struct.Struct("<32sQQq")
+WRITE_CHUNK = 4096
+
+# Helper Functions
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+def simulate_latency():
+    value = os.environ.get("QCLIENT_SIM_LATENCY", "0")
+    try:
+        if "-" in value:
+            low, high = (float(v) for v in value.split("-", 1))
+            delay = random.uniform(low, high)
+        else:
+            delay = float(value)
+    except ValueError:
+        delay = 0
+    if delay > 0:
+        time.sleep(delay)
+
+def maybe_fail():
+    if random.random() < env_float("QCLIENT_SIM_FAILURE_RATE", 0):
+        fail("rpc error: code = Unavailable desc = simulated failure")
+
+def fail(msg, code=1):
+    sys.stderr.write(f"Error: {msg}\n")
+    sys.exit(code)
+
+def current_frame(now=None):
+    return int(((now or time.time()) - GENESIS_TIME) // FRAME_SECONDS)
+
+def format_units(units):
+    return f"{units // UNITS_PER_QUIL}.{units % UNITS_PER_QUIL:012d}"
+
+def parse_units(amount):
+    try:
+        value = Decimal(amount)
+    except InvalidOperation:
+        fail(f"invalid amount: {amount}")
+    if value <= 0:
+        fail(f"invalid amount: {amount}")
+    return int(value * UNITS_PER_QUIL)
+
+def parse_coin_id(coin_id):
+    if not coin_id.startswith("0x") or len(coin_id) != 66:
+        fail(f"invalid coin id: {coin_id}")
+    try:
+        return bytes.fromhex(coin_id[2:])
+    except ValueError:
+        fail(f"invalid coin id: {coin_id}")
+
+def new_coin_id(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+    digest.update(os.urandom(8))
+    return digest.digest()
+
+def format_timestamp(ts):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+def parse_args(argv):
+    config = None
+    args = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--config" and i + 1 < len(argv):
+            config = argv[i + 1]
+            i += 2
+            continue
+        if arg.startswith("--config="):
+            config = arg.split("=", 1)[1]
+        elif not arg.startswith("--"):
+            args.append(arg)
+        i += 1
+    return config, args
+
+# Wallet State
+class SimWallet:
+    def __init__(self, config):
+        self.config = Path(config or Path.home() / ".config").resolve()
+        self.state_dir = Path(os.environ.get("QCLIENT_SIM_STATE") or self.config / "qclient-sim")
+        self.coins_file = self.state_dir / "coins.dat"
+        self.pending_file = self.state_dir / "pending.json"
+        self.lock_file = None
+
+    def __enter__(self):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.lock_file = open(self.state_dir / ".lock", "a+")
+        if fcntl:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        if not self.coins_file.exists():
+            self.seed(int(env_float("QCLIENT_SIM_COINS", 10)))
+        self.apply_confirmed()
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+    @property
+    def account(self):
+        return "0x" + hashlib.sha256(b"account:" + str(self.config).encode()).hexdigest()
+
+    def seed(self, count, dust_ratio=0.5):
+        rng = random.Random(os.environ.get("QCLIENT_SIM_SEED") or str(self.config))
+        now = time.time()
+        frame = current_frame(now)
+        tmp = self.coins_file.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            buf = []
+            for i in range(count):
+                coin_id = hashlib.sha256(f"{self.config}:{rng.random()}:{i}".encode()).digest()
+                if rng.random() < dust_ratio:
+                    units = rng.randint(1, UNITS_PER_QUIL // 100)
+                else:
+                    units = rng.randint(UNITS_PER_QUIL // 100, 50 * UNITS_PER_QUIL)
+                age = rng.randint(0, 90 * 24 * 3600)
+                coin_frame = max(frame - age // FRAME_SECONDS, 0)
+                buf.append(COIN_RECORD.pack(coin_id, units, coin_frame, int(now - age)))
+                if len(buf) >= WRITE_CHUNK:
+                    f.write(b"".join(buf))
+                    buf = []
+            f.write(b"".join(buf))
+        os.replace(tmp, self.coins_file)
+        if self.pending_file.exists():
+            self.pending_file.unlink()
+
+    def iter_coins(self):
+        with open(self.coins_file, "rb") as f:
+            while True:
+                chunk = f.read(COIN_RECORD.size * WRITE_CHUNK)
+                if not chunk:
+                    return
+                yield from COIN_RECORD.iter_unpack(chunk)
+
+    def rewrite(self, remove, add):
+        tmp = self.coins_file.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            buf = []
+            for record in self.iter_coins():
+                if record[0] in remove:
+                    continue
+                buf.append(COIN_RECORD.pack(*record))
+                if len(buf) >= WRITE_CHUNK:
+                    f.write(b"".join(buf))
+                    buf = []
+            buf.extend(COIN_RECORD.pack(*record) for record in add)
+            f.write(b"".join(buf))
+        os.replace(tmp, self.coins_file)
+
+    def load_pending(self):
+        if not self.pending_file.exists():
+            return []
+        with open(self.pending_file) as f:
+            return json.load(f)
+
+    def save_pending(self, pending):
+        tmp = self.pending_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(pending, f)
+        os.replace(tmp, self.pending_file)
+
+    def apply_confirmed(self):
+        pending = self.load_pending()
+        if not pending:
+            return
+        now = time.time()
+        due = [op for op in pending if op["apply_at"] <= now]
+        if not due:
+            return
+        remove = set()
+        add = []
+        frame = current_frame(now)
+        for op in due:
+            remove.update(bytes.fromhex(c) for c in op["remove"])
+            add.extend((bytes.fromhex(c), units, frame, int(now)) for c, units in op["add"])
+        self.rewrite(remove, add)
+        self.save_pending([op for op in pending if op["apply_at"] > now])
+
+    def submit(self, remove, add):
+        pending = self.load_pending()
+        for op in pending:
+            if set(op["remove"]) & {c.hex() for c in remove}:
+                fail("coin is already being spent by a pending transaction")
+        op = {
+            "apply_at": time.time() + env_float("QCLIENT_SIM_CONFIRM_DELAY", 0),
+            "remove": [c.hex() for c in remove],
+            "add": [[c.hex(), units] for c, units in add],
+        }
+        pending.append(op)
+        self.save_pending(pending)
+        self.apply_confirmed()
+
+    def lookup(self, coin_ids):
+        wanted = set(coin_ids)
+        found = {}
+        for record in self.iter_coins():
+            if record[0] in wanted:
+                found[record[0]] = record
+                if len(found) == len(wanted):
+                    break
+        for coin_id in wanted:
+            if coin_id not in found:
+                fail(f"coin not found: 0x{coin_id.hex()}")
+        return found
+
+# Token Commands
+def cmd_balance(wallet, args):
+    total = sum(record[1] for record in wallet.iter_coins())
+    print(f"Total balance: {format_units(total)} QUIL (Account {wallet.account})")
+
+def cmd_coins(wallet, args):
+    metadata = bool(args) and args[0] == "metadata"
+    out = sys.stdout
+    buf = []
+    for coin_id, units, frame, ts in wallet.iter_coins():
+        line = f"{format_units(units)} QUIL (Coin 0x{coin_id.hex()})"
+        if metadata:
+            line += f" Frame {frame}, Timestamp {format_timestamp(ts)}"
+        buf.append(line)
+        if len(buf) >= WRITE_CHUNK:
+            out.write("\n".join(buf) + "\n")
+            buf = []
+    if buf:
+        out.write("\n".join(buf) + "\n")
+    out.flush()
+
+def cmd_transfer(wallet, args):
+    if len(args) != 2:
+        fail("usage: token transfer <to_address> <coin_id>")
+    to_address, coin_id = args
+    parse_coin_id(to_address)
+    coin = parse_coin_id(coin_id)
+    wallet.lookup([coin])
+    wallet.submit([coin], [])
+    print(f"Transfer of coin {coin_id} to {to_address} submitted")
+
+def cmd_merge(wallet, args):
+    if args == ["all"]:
+        coins = {record[0]: record for record in wallet.iter_coins()}
+    else:
+        coins = wallet.lookup([parse_coin_id(c) for c in args])
+    if len(coins) < 2:
+        fail("merge requires at least two coins")
+    total = sum(record[1] for record in coins.values())
+    new_id = new_coin_id("merge", *coins)
+    wallet.submit(list(coins), [(new_id, total)])
+    print(f"Merge of {len(coins)} coins submitted, new coin 0x{new_id.hex()} ({format_units(total)} QUIL)")
+
+def cmd_split(wallet, args):
+    if len(args) < 3:
+        fail("usage: token split <coin_id> <amount> <amount> [...]")
+    coin = parse_coin_id(args[0])
+    record = wallet.lookup([coin])[coin]
+    amounts = [parse_units(a) for a in args[1:]]
+    if sum(amounts) != record[1]:
+        fail(f"split amounts ({format_units(sum(amounts))}) do not match coin amount ({format_units(record[1])})")
+    new_coins = [(new_coin_id("split", coin.hex(), i), units) for i, units in enumerate(amounts)]
+    wallet.submit([coin], new_coins)
+    print(f"Split of coin {args[0]} into {len(amounts)} coins submitted")
+
+TOKEN_COMMANDS = {
+    "balance": cmd_balance,
+    "coins": cmd_coins,
+    "transfer": cmd_transfer,
+    "merge": cmd_merge,
+    "split": cmd_split,
+}
+
+# Simulator Administration
+def sim_install(args):
+    target_dir = Path(args[0] if args else ".").resolve()
+    system = platform.system().lower()
+    arch = {"x86_64": "amd64", "amd64": "amd64", "arm64": "arm64", "aarch64": "arm64"}.get(platform.machine().lower(), "amd64")
+    suffix = ".exe" if system == "windows" else ""
+    target = target_dir / f"qclient-{SIM_VERSION}-{system}-{arch}{suffix}"
+    target_dir.mkdir(parents=True, exist_ok=True)
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    target.symlink_to(Path(__file__).resolve())
+    Path(__file__).chmod(Path(__file__).stat().st_mode | 0o111)
+    print(f"Installed simulator as {target}")
+
+def sim_seed(config, args):
+    if not args or not args[0].isdigit():
+        fail("usage: sim seed <coin_count> [dust_ratio] --config <dir>")
+    dust_ratio = float(args[1]) if len(args) > 1 else 0.5
+    with SimWallet(config) as wallet:
+        wallet.seed(int(args[0]), dust_ratio)
+    print(f"Seeded {args[0]} coins in {wallet.coins_file}")
+
+def main(argv):
+    config, args = parse_args(argv)
+    if args[:2] == ["sim", "install"]:
+        return sim_install(args[2:])
+    if args[:2] == ["sim", "seed"]:
+        return sim_seed(config, args[2:])
+    if len(args) < 2 or args[0] != "token" or args[1] not in TOKEN_COMMANDS:
+        fail(f"unsupported command: {' '.join(args) or '(none)'}")
+    simulate_latency()
+    maybe_fail()
+    with SimWallet(config) as wallet:
+        TOKEN_COMMANDS[args[1]](wallet, args[2:])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])